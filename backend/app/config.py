@@ -1 +1,10 @@
 OPENAI_GPT4O_MINI = "gpt-4o-mini"
+
+# Approximate prompt tokens of chat history each agent receives, see app/utils/history.py
+DEFAULT_HISTORY_TOKEN_BUDGET = 6000
+SUMMARY_HISTORY_TOKEN_BUDGET = 12000
+HISTORY_KEEP_RECENT_MESSAGES = 4
+
+# Limits of the agent loop in QueryService, overridable per API key in the user table
+DEFAULT_MAX_AGENT_HOPS = 12
+DEFAULT_QUERY_DEADLINE_SECONDS = 60.0
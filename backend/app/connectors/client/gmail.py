@@ -1,19 +1,56 @@
+import asyncio
 import base64
+import hashlib
+import logging
+import os
+import time
 from email.mime.text import MIMEText
+from typing import Any, AsyncIterator, Iterator, Optional
 
+from dotenv import load_dotenv
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
+from app.connectors.client.gmail_cache import GMAIL_MESSAGE_CACHE, GmailMailboxCache
 from app.exceptions.exception import InferenceError
 from app.models.integrations.gmail import (
     Gmail,
+    GmailBulkResult,
     GmailDeleteEmailsRequest,
+    GmailFetchProfile,
     GmailFilterEmailsRequest,
     GmailSendEmailRequest,
     MarkAsReadRequest,
 )
+from app.utils.batches import batches
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()
 
 TOKEN_URI = "https://oauth2.googleapis.com/token"
+# Gmail allows 100 calls per batch request but recommends at most 50, larger batches are likely to be rate limited
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+# Calls of a batch that are rate limited or hit a server error are sent again in a later batch, up to this many times
+GMAIL_BATCH_MAX_RETRIES = int(os.getenv("GMAIL_BATCH_MAX_RETRIES", "2"))
+GMAIL_BATCH_RETRY_BACKOFF_SECONDS = float(
+    os.getenv("GMAIL_BATCH_RETRY_BACKOFF_SECONDS", "1")
+)
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Most ids users.messages.batchModify and batchDelete accept per call
+GMAIL_BULK_CHUNK_SIZE = 1000
+# Headers requested by the metadata profile, the only ones Gmail returns for it
+METADATA_HEADERS = ["From", "Subject"]
+# Message ids listed per page, one page is fetched with a single batch request
+GMAIL_LIST_PAGE_SIZE = int(os.getenv("GMAIL_LIST_PAGE_SIZE", str(GMAIL_BATCH_SIZE)))
+# Upper bound on the emails a single query retrieves, and on the ones a bulk operation fetches to show the user
+GMAIL_MAX_RESULTS = int(os.getenv("GMAIL_MAX_RESULTS", "100"))
+# Upper bound on the emails a single mark as read or delete affects, only their ids are listed
+GMAIL_BULK_MAX_RESULTS = int(os.getenv("GMAIL_BULK_MAX_RESULTS", "10000"))
+# Most ids users.messages.list returns per page
+GMAIL_BULK_LIST_PAGE_SIZE = 500
 
 
 class GmailClient:
@@ -32,6 +69,10 @@ class GmailClient:
                 token_uri=TOKEN_URI,
             ),
         )
+        # Access tokens expire, the refresh token identifies the mailbox for as long as it is connected
+        self._cache: GmailMailboxCache = GMAIL_MESSAGE_CACHE.get_mailbox(
+            key=hashlib.sha256((refresh_token or access_token).encode()).hexdigest()
+        )
 
     def send_email(self, request: GmailSendEmailRequest) -> Gmail:
         try:
@@ -59,127 +100,338 @@ class GmailClient:
         except Exception as e:
             raise InferenceError("Error sending email via GmailClient: %s", str(e))
 
-    def mark_as_read(self, request: MarkAsReadRequest) -> list[Gmail]:
-        emails_to_update: list[Gmail] = self.get_emails(request=request)
-        updated_emails: list[Gmail] = []
-        for email in emails_to_update:
-            self.service.users().messages().modify(
+    def mark_as_read(self, request: MarkAsReadRequest) -> GmailBulkResult:
+        try:
+            message_ids, truncated = self._list_bulk_message_ids(request=request)
+            # Bodies are not needed to tell the user which emails were marked as read
+            emails: list[Gmail] = self._get_messages(
+                message_ids=message_ids[:GMAIL_MAX_RESULTS],
+                profile=GmailFetchProfile.METADATA,
+            )
+            self.modify_labels(message_ids=message_ids, remove_label_ids=["UNREAD"])
+            for email in emails:
+                if "UNREAD" in email.labelIds:
+                    email.labelIds.remove("UNREAD")
+            return GmailBulkResult(
+                emails=emails, count=len(message_ids), truncated=truncated
+            )
+        except Exception as e:
+            raise InferenceError(f"Error marking emails as read via GmailClient: {e}")
+
+    def modify_labels(
+        self,
+        message_ids: list[str],
+        add_label_ids: list[str] = [],
+        remove_label_ids: list[str] = [],
+    ) -> None:
+        """Adds and removes the labels of up to GMAIL_BULK_CHUNK_SIZE messages per call"""
+        for chunk in batches(message_ids, size=GMAIL_BULK_CHUNK_SIZE):
+            self.service.users().messages().batchModify(
                 userId="me",
-                id=email.id,
-                body={"removeLabelIds": ["UNREAD"]},
+                body={
+                    "ids": chunk,
+                    "addLabelIds": add_label_ids,
+                    "removeLabelIds": remove_label_ids,
+                },
             ).execute()
-            email.labelIds.remove("UNREAD")
-            updated_emails.append(email)
-        return updated_emails
+            with self._cache.lock:
+                self._cache.update_labels(
+                    message_ids=chunk,
+                    add_label_ids=add_label_ids,
+                    remove_label_ids=remove_label_ids,
+                )
+
+    def delete_messages(self, message_ids: list[str]) -> None:
+        """Permanently deletes up to GMAIL_BULK_CHUNK_SIZE messages per call"""
+        for chunk in batches(message_ids, size=GMAIL_BULK_CHUNK_SIZE):
+            self.service.users().messages().batchDelete(
+                userId="me", body={"ids": chunk}
+            ).execute()
+            with self._cache.lock:
+                self._cache.evict(message_ids=chunk)
 
-    def get_emails(self, request: GmailFilterEmailsRequest) -> list[Gmail]:
+    def get_emails(
+        self,
+        request: GmailFilterEmailsRequest,
+        profile: GmailFetchProfile = GmailFetchProfile.FULL,
+    ) -> list[Gmail]:
         try:
-            gmail_lst: list[Gmail] = []
+            return [
+                email
+                for message_ids in self._iter_message_ids(request=request)
+                for email in self._get_messages(
+                    message_ids=message_ids, profile=profile
+                )
+            ]
+        except Exception as e:
+            print(
+                f"Error getting emails via GmailClient: {e}"
+            )  # Print the error for debugging
+            raise InferenceError(f"Error getting emails via GmailClient: {e}")
 
-            if request.message_ids:
-                for message_id in request.message_ids:
-                    full_msg = (
-                        self.service.users()
-                        .messages()
-                        .get(userId="me", id=message_id)
-                        .execute()
-                    )
+    async def iter_emails(
+        self,
+        request: GmailFilterEmailsRequest,
+        profile: GmailFetchProfile = GmailFetchProfile.FULL,
+    ) -> AsyncIterator[Gmail]:
+        """Yields the emails matching the request, newest first, as each page of them is fetched"""
+        message_id_pages: Iterator[list[str]] = self._iter_message_ids(request=request)
+        while True:
+            try:
+                # The Google client is blocking, so every page is listed and fetched in a worker thread
+                message_ids: Optional[list[str]] = await asyncio.to_thread(
+                    next, message_id_pages, None
+                )
+                if message_ids is None:
+                    return
+                emails: list[Gmail] = await asyncio.to_thread(
+                    self._get_messages, message_ids=message_ids, profile=profile
+                )
+            except Exception as e:
+                raise InferenceError(f"Error getting emails via GmailClient: {e}")
+            for email in emails:
+                yield email
 
-                    headers = full_msg["payload"]["headers"]
-                    gmail_lst.append(
-                        Gmail(
-                            id=full_msg["id"],
-                            labelIds=full_msg["labelIds"],
-                            sender=next(
-                                (
-                                    header["value"]
-                                    for header in headers
-                                    if header["name"].lower() == "from"
-                                ),
-                                "",
-                            ),
-                            subject=next(
-                                (
-                                    header["value"]
-                                    for header in headers
-                                    if header["name"].lower() == "subject"
-                                ),
-                                "",
-                            ),
-                            body=_get_message_body(full_msg["payload"]),
-                        )
-                    )
-            elif request.query:
-                messages = (
-                    self.service.users()
-                    .messages()
-                    .list(userId="me", q=request.query)
-                    .execute()
+    def _iter_message_ids(
+        self,
+        request: GmailFilterEmailsRequest,
+        limit: int = GMAIL_MAX_RESULTS,
+        page_size: int = GMAIL_LIST_PAGE_SIZE,
+    ) -> Iterator[list[str]]:
+        """Yields the ids of the messages the request refers to one page at a time, listing at most max_results (and never more than limit) messages of a query"""
+        if request.message_ids:
+            yield from batches(request.message_ids, size=page_size)
+            return
+
+        max_results: int = min(request.max_results or limit, limit)
+        remaining: int = max_results
+        page_token: Optional[str] = None
+        while remaining > 0:
+            # Gmail lists the newest messages first, so stopping early keeps the most recent ones
+            response = (
+                self.service.users()
+                .messages()
+                .list(
+                    userId="me",
+                    q=request.query,
+                    maxResults=min(page_size, remaining),
+                    pageToken=page_token,
                 )
+                .execute()
+            )
+            message_ids: list[str] = [
+                message["id"] for message in response.get("messages", [])
+            ][:remaining]
+            if message_ids:
+                yield message_ids
+            remaining -= len(message_ids)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+        if not request.max_results or request.max_results > limit:
+            log.warning(f"Stopped listing Gmail messages after {max_results} results")
 
-                for message in messages.get("messages", []):
-                    full_msg = (
+    def _list_bulk_message_ids(
+        self, request: GmailFilterEmailsRequest
+    ) -> tuple[list[str], bool]:
+        """Lists the ids of every message a bulk operation applies to, at most GMAIL_BULK_MAX_RESULTS, and whether the query matched more than that"""
+        if request.message_ids:
+            return request.message_ids, False
+        if request.max_results and request.max_results <= GMAIL_BULK_MAX_RESULTS:
+            return [
+                message_id
+                for message_ids in self._iter_message_ids(
+                    request=request,
+                    limit=GMAIL_BULK_MAX_RESULTS,
+                    page_size=GMAIL_BULK_LIST_PAGE_SIZE,
+                )
+                for message_id in message_ids
+            ], False
+        # One more id than allowed is listed to tell whether the query matched more
+        message_ids: list[str] = [
+            message_id
+            for message_ids in self._iter_message_ids(
+                request=request.model_copy(
+                    update={"max_results": GMAIL_BULK_MAX_RESULTS + 1}
+                ),
+                limit=GMAIL_BULK_MAX_RESULTS + 1,
+                page_size=GMAIL_BULK_LIST_PAGE_SIZE,
+            )
+            for message_id in message_ids
+        ]
+        truncated: bool = len(message_ids) > GMAIL_BULK_MAX_RESULTS
+        if truncated:
+            log.warning(
+                f"Gmail query matched more than {GMAIL_BULK_MAX_RESULTS} messages, only the newest are affected"
+            )
+        return message_ids[:GMAIL_BULK_MAX_RESULTS], truncated
+
+    def _get_messages(
+        self, message_ids: list[str], profile: GmailFetchProfile
+    ) -> list[Gmail]:
+        """Returns the messages from the mailbox cache where possible and fetches the rest, leaving out the ones that could not be fetched. Fields outside the profile are left empty."""
+        self._revalidate_cache()
+        emails: dict[str, Gmail] = {}
+        with self._cache.lock:
+            for message_id in message_ids:
+                email: Optional[Gmail] = self._cache.get(
+                    message_id=message_id, profile=profile
+                )
+                if email:
+                    emails[message_id] = email
+
+        missing_ids: list[str] = [
+            message_id for message_id in message_ids if message_id not in emails
+        ]
+        # A message's historyId is its own last change, so the cursor starts from the mailbox's position before the fetch instead
+        history_id: Optional[str] = (
+            self.service.users().getProfile(userId="me").execute()["historyId"]
+            if missing_ids and not self._cache.history_id
+            else None
+        )
+        full_msgs: dict[str, dict[str, Any]] = self._fetch_messages(
+            message_ids=missing_ids, profile=profile
+        )
+        with self._cache.lock:
+            for message_id, full_msg in full_msgs.items():
+                emails[message_id] = _to_gmail(full_msg, profile=profile)
+                self._cache.put(email=emails[message_id], profile=profile)
+            if history_id:
+                self._cache.start_history(history_id=history_id)
+        log.info(
+            f"Served {len(message_ids) - len(missing_ids)} of {len(message_ids)} Gmail messages from the cache"
+        )
+
+        return [
+            emails[message_id] for message_id in message_ids if message_id in emails
+        ]
+
+    def _revalidate_cache(self) -> None:
+        """Replays the mailbox history since the cache was last validated, which only costs a call per page of changes"""
+        # Held during the call, so that concurrent reads of the mailbox wait for one revalidation instead of each sending their own
+        with self._cache.lock:
+            if not self._cache.needs_revalidation():
+                return
+            records: list[dict[str, Any]] = []
+            page_token: Optional[str] = None
+            try:
+                while True:
+                    response = (
                         self.service.users()
-                        .messages()
-                        .get(userId="me", id=message["id"])
+                        .history()
+                        .list(
+                            userId="me",
+                            startHistoryId=self._cache.history_id,
+                            pageToken=page_token,
+                        )
                         .execute()
                     )
+                    records.extend(response.get("history", []))
+                    page_token = response.get("nextPageToken")
+                    if not page_token:
+                        break
+            except HttpError as e:
+                # Gmail only keeps about a week of history, older history ids are rejected with a 404
+                if e.resp.status != 404:
+                    raise
+                log.info("Gmail history id expired, clearing the mailbox cache")
+                self._cache.clear()
+                return
+            self._cache.apply_history(records=records, history_id=response["historyId"])
 
-                    headers = full_msg["payload"]["headers"]
-                    gmail_lst.append(
-                        Gmail(
-                            id=message["id"],
-                            labelIds=full_msg["labelIds"],
-                            sender=next(
-                                (
-                                    header["value"]
-                                    for header in headers
-                                    if header["name"].lower() == "from"
-                                ),
-                                "",
-                            ),
-                            subject=next(
-                                (
-                                    header["value"]
-                                    for header in headers
-                                    if header["name"].lower() == "subject"
-                                ),
-                                "",
+    def _fetch_messages(
+        self, message_ids: list[str], profile: GmailFetchProfile
+    ) -> dict[str, dict[str, Any]]:
+        """Fetches the messages with one batch request per GMAIL_BATCH_SIZE ids instead of one request each, leaving out the ones that could not be fetched"""
+        full_msgs: dict[str, dict[str, Any]] = {}
+        failed_ids: list[str] = []
+
+        def _on_response(
+            request_id: str, response: Optional[dict], exception: Optional[Exception]
+        ) -> None:
+            if exception is None:
+                full_msgs[request_id] = response
+            elif (
+                isinstance(exception, HttpError)
+                and exception.resp.status in RETRYABLE_STATUSES
+            ):
+                failed_ids.append(request_id)
+            else:
+                log.warning(f"Failed to get Gmail message {request_id}: {exception}")
+
+        pending_ids: list[str] = list(dict.fromkeys(message_ids))
+        for attempt in range(GMAIL_BATCH_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(GMAIL_BATCH_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            for batch_ids in batches(pending_ids, size=GMAIL_BATCH_SIZE):
+                batch = self.service.new_batch_http_request(callback=_on_response)
+                for message_id in batch_ids:
+                    batch.add(
+                        self.service.users()
+                        .messages()
+                        .get(
+                            userId="me",
+                            id=message_id,
+                            format=profile.value,
+                            metadataHeaders=(
+                                METADATA_HEADERS
+                                if profile == GmailFetchProfile.METADATA
+                                else None
                             ),
-                            body=_get_message_body(full_msg["payload"]),
-                        )
+                        ),
+                        request_id=message_id,
                     )
-            return gmail_lst
-        except Exception as e:
-            print(
-                f"Error getting emails via GmailClient: {e}"
-            )  # Print the error for debugging
-            raise InferenceError(f"Error getting emails via GmailClient: {e}")
+                batch.execute()
+            if not failed_ids:
+                break
+            pending_ids, failed_ids = failed_ids, []
+        else:
+            log.warning(
+                f"Gave up getting {len(pending_ids)} Gmail messages after {GMAIL_BATCH_MAX_RETRIES} retries"
+            )
+
+        return full_msgs
 
-    def delete_emails(self, request: GmailDeleteEmailsRequest) -> list[Gmail]:
+    def delete_emails(self, request: GmailDeleteEmailsRequest) -> GmailBulkResult:
         try:
-            gmail_lst: list[Gmail] = self.get_emails(request=request)
-            if request.message_ids:
-                for message_id in request.message_ids:
-                    self.service.users().messages().delete(
-                        userId="me", id=message_id
-                    ).execute()
-            elif request.query:
-                messages = (
-                    self.service.users()
-                    .messages()
-                    .list(userId="me", q=request.query)
-                    .execute()
-                )
-                for message in messages.get("messages", []):
-                    self.service.users().messages().delete(
-                        userId="me", id=message["id"]
-                    ).execute()
-            return gmail_lst
+            message_ids, truncated = self._list_bulk_message_ids(request=request)
+            # Deleted emails can no longer be fetched, so enough of them is kept to tell the user what was deleted
+            emails: list[Gmail] = self._get_messages(
+                message_ids=message_ids[:GMAIL_MAX_RESULTS],
+                profile=GmailFetchProfile.METADATA,
+            )
+            # The listed ids are deleted as they are, instead of listing the query a second time
+            self.delete_messages(message_ids=message_ids)
+            return GmailBulkResult(
+                emails=emails, count=len(message_ids), truncated=truncated
+            )
         except Exception as e:
             raise InferenceError("Error deleting emails via GmailClient: %s", str(e))
 
 
+def _to_gmail(full_msg: dict[str, Any], profile: GmailFetchProfile) -> Gmail:
+    # Minimal messages come without a payload, metadata ones without a body
+    payload: dict[str, Any] = full_msg.get("payload", {})
+    headers = payload.get("headers", [])
+    return Gmail(
+        id=full_msg["id"],
+        labelIds=full_msg["labelIds"],
+        sender=next(
+            (header["value"] for header in headers if header["name"].lower() == "from"),
+            "",
+        ),
+        subject=next(
+            (
+                header["value"]
+                for header in headers
+                if header["name"].lower() == "subject"
+            ),
+            "",
+        ),
+        body=(_get_message_body(payload) if profile == GmailFetchProfile.FULL else ""),
+    )
+
+
 def _get_message_body(payload):
     """
     Recursively extract the message body from the payload.
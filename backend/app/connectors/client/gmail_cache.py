@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+from app.models.integrations.gmail import Gmail, GmailFetchProfile
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Messages kept per mailbox, the least recently used ones are dropped first
+GMAIL_CACHE_MAX_MESSAGES = int(os.getenv("GMAIL_CACHE_MAX_MESSAGES", "1000"))
+GMAIL_CACHE_MAX_MAILBOXES = int(os.getenv("GMAIL_CACHE_MAX_MAILBOXES", "128"))
+# Reads within this many seconds of the last history call trust the cache without asking Gmail for changes
+GMAIL_CACHE_REVALIDATE_SECONDS = float(os.getenv("GMAIL_CACHE_REVALIDATE_SECONDS", "5"))
+# A cached message serves any profile up to the one it was fetched with
+PROFILE_RANKS: dict[GmailFetchProfile, int] = {
+    GmailFetchProfile.MINIMAL: 0,
+    GmailFetchProfile.METADATA: 1,
+    GmailFetchProfile.FULL: 2,
+}
+
+
+class GmailMailboxCache:
+    """Parsed messages of one mailbox, kept current by replaying users.history.list from the last known historyId."""
+
+    def __init__(self):
+        self._messages: OrderedDict[str, tuple[GmailFetchProfile, Gmail]] = (
+            OrderedDict()
+        )
+        self.history_id: Optional[int] = None
+        self.validated_at: float = 0.0
+        # The Google client runs in worker threads, so agents of the same mailbox can use the cache concurrently
+        self.lock = threading.Lock()
+
+    def needs_revalidation(self) -> bool:
+        return bool(
+            self.history_id
+            and time.monotonic() - self.validated_at >= GMAIL_CACHE_REVALIDATE_SECONDS
+        )
+
+    def get(self, message_id: str, profile: GmailFetchProfile) -> Optional[Gmail]:
+        cached: Optional[tuple[GmailFetchProfile, Gmail]] = self._messages.get(
+            message_id
+        )
+        if not cached or PROFILE_RANKS[cached[0]] < PROFILE_RANKS[profile]:
+            return None
+        self._messages.move_to_end(message_id)
+        # Callers may modify the emails they get, e.g. their labels
+        return cached[1].model_copy(deep=True)
+
+    def put(self, email: Gmail, profile: GmailFetchProfile) -> None:
+        cached: Optional[tuple[GmailFetchProfile, Gmail]] = self._messages.get(email.id)
+        if cached and PROFILE_RANKS[cached[0]] > PROFILE_RANKS[profile]:
+            # Keep the body of a full message, but take the newer labels
+            cached[1].labelIds = email.labelIds
+        else:
+            self._messages[email.id] = (profile, email.model_copy(deep=True))
+        self._messages.move_to_end(email.id)
+        while len(self._messages) > GMAIL_CACHE_MAX_MESSAGES:
+            self._messages.popitem(last=False)
+
+    def start_history(self, history_id: str) -> None:
+        """Sets the history cursor to the mailbox historyId read before messages were fetched, which the fetched messages are at least as new as"""
+        # Replaying history the cached messages already reflect leaves them unchanged, so of two concurrent starts the older one is kept
+        if not self.history_id or int(history_id) < self.history_id:
+            self.history_id = int(history_id)
+            self.validated_at = time.monotonic()
+
+    def evict(self, message_ids: list[str]) -> None:
+        for message_id in message_ids:
+            self._messages.pop(message_id, None)
+
+    def update_labels(
+        self,
+        message_ids: list[str],
+        add_label_ids: list[str] = [],
+        remove_label_ids: list[str] = [],
+    ) -> None:
+        for message_id in message_ids:
+            if message_id not in self._messages:
+                continue
+            email: Gmail = self._messages[message_id][1]
+            email.labelIds = [
+                label_id
+                for label_id in email.labelIds
+                if label_id not in remove_label_ids
+            ] + [
+                label_id for label_id in add_label_ids if label_id not in email.labelIds
+            ]
+
+    def apply_history(self, records: list[dict[str, Any]], history_id: str) -> None:
+        """Applies the records of users.history.list in order, only deletions and label changes affect cached messages"""
+        for record in records:
+            self.evict(
+                [
+                    deleted["message"]["id"]
+                    for deleted in record.get("messagesDeleted", [])
+                ]
+            )
+            for added in record.get("labelsAdded", []):
+                self.update_labels(
+                    message_ids=[added["message"]["id"]],
+                    add_label_ids=added.get("labelIds", []),
+                )
+            for removed in record.get("labelsRemoved", []):
+                self.update_labels(
+                    message_ids=[removed["message"]["id"]],
+                    remove_label_ids=removed.get("labelIds", []),
+                )
+        self.history_id = int(history_id)
+        self.validated_at = time.monotonic()
+
+    def clear(self) -> None:
+        self._messages.clear()
+        self.history_id = None
+
+
+class GmailMessageCache:
+    """Keeps a GmailMailboxCache per mailbox for the whole process, since a GmailClient only lives for a single request"""
+
+    def __init__(self):
+        self._mailboxes: OrderedDict[str, GmailMailboxCache] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_mailbox(self, key: str) -> GmailMailboxCache:
+        with self._lock:
+            if key not in self._mailboxes:
+                self._mailboxes[key] = GmailMailboxCache()
+            self._mailboxes.move_to_end(key)
+            while len(self._mailboxes) > GMAIL_CACHE_MAX_MAILBOXES:
+                self._mailboxes.popitem(last=False)
+            return self._mailboxes[key]
+
+
+GMAIL_MESSAGE_CACHE = GmailMessageCache()
@@ -1,25 +1,108 @@
+import asyncio
+import hashlib
 import json
 import logging
-
+import os
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Optional
+
+import httpx
 import requests
-from gql import Client, gql
-from gql.transport.requests import RequestsHTTPTransport
-
+from dotenv import load_dotenv
+from gql import Client
+from gql.client import AsyncClientSession
+from gql.transport.exceptions import TransportError, TransportQueryError
+from gql.transport.httpx import HTTPXAsyncTransport
+from graphql import DocumentNode, GraphQLSchema
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.connectors.client.linear_documents import (
+    WORKSPACE_TARGETS_BY_NAME,
+    WORKSPACE_TARGETS_BY_NUMBER,
+    LinearOperation,
+    get_linear_document,
+)
+from app.connectors.client.linear_mirror import LINEAR_ISSUE_MIRROR
+from app.connectors.client.linear_scheduler import LinearRateLimitScheduler
+from app.connectors.client.linear_schema import LINEAR_SCHEMA_CACHE
+from app.connectors.native.stores.linear_issue import LinearIssueSyncORM
 from app.models.integrations.linear import (
+    LinearBulkResult,
     LinearCreateIssueRequest,
     LinearDeleteIssuesRequest,
+    LinearFilterIssuesRequest,
     LinearGetIssuesRequest,
     LinearIssue,
+    LinearIssueFieldProfile,
     LinearUpdateIssuesRequest,
+    LinearWorkspaceMetadata,
 )
+from app.utils.batches import batches
+from app.utils.fuzzy import FuzzyNameIndex, UnconfirmedNameError, is_same_name
 
 logging.getLogger("gql").setLevel(logging.WARNING)
-logging.getLogger("gql.transport.requests").setLevel(logging.WARNING)
+logging.getLogger("gql.transport.httpx").setLevel(logging.WARNING)
 logging.basicConfig(level=logging.INFO)
 
 log = logging.getLogger(__name__)
 
+load_dotenv()
+
 LINEAR_API_URL = "https://api.linear.app/graphql"
+LINEAR_MAX_CONNECTIONS = int(os.getenv("LINEAR_MAX_CONNECTIONS", "20"))
+LINEAR_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("LINEAR_MAX_KEEPALIVE_CONNECTIONS", "5")
+)
+LINEAR_KEEPALIVE_EXPIRY = float(os.getenv("LINEAR_KEEPALIVE_EXPIRY", "60"))
+LINEAR_CONNECT_TIMEOUT = float(os.getenv("LINEAR_CONNECT_TIMEOUT", "5"))
+LINEAR_READ_TIMEOUT = float(os.getenv("LINEAR_READ_TIMEOUT", "30"))
+# Number of access tokens whose client (and connection pool) is kept alive at the same time
+LINEAR_CLIENT_CACHE_SIZE = int(os.getenv("LINEAR_CLIENT_CACHE_SIZE", "128"))
+# How long the users, projects, cycles, states, labels and teams of a workspace are cached for id lookups
+LINEAR_METADATA_TTL_SECONDS = float(os.getenv("LINEAR_METADATA_TTL_SECONDS", "300"))
+# A full issue (with its first 50 labels and comments) costs roughly 200 complexity points and Linear rejects queries above 10,000, so pages of 25 use about half of that
+LINEAR_ISSUES_PAGE_SIZE = int(os.getenv("LINEAR_ISSUES_PAGE_SIZE", "25"))
+# Summaries leave out the comments and ids every connection, so their pages can be larger
+LINEAR_ISSUES_PAGE_SIZES: dict[LinearIssueFieldProfile, int] = {
+    LinearIssueFieldProfile.IDS: 250,  # Largest page Linear allows
+    LinearIssueFieldProfile.SUMMARY: 50,
+    LinearIssueFieldProfile.FULL: LINEAR_ISSUES_PAGE_SIZE,
+}
+# Upper bound on the issues a single request retrieves, and on the ones an update or delete returns to show the user
+LINEAR_MAX_ISSUES = int(os.getenv("LINEAR_MAX_ISSUES", "500"))
+# Upper bound on the issues a single update or delete affects
+LINEAR_BULK_MAX_ISSUES = int(os.getenv("LINEAR_BULK_MAX_ISSUES", "5000"))
+# Linear rejects documents above 10,000 complexity points and a full issue (with its first 50 labels and comments) costs roughly 200, so 25 aliased mutations per request leave plenty of headroom
+LINEAR_MUTATION_BATCH_SIZE = int(os.getenv("LINEAR_MUTATION_BATCH_SIZE", "25"))
+# Issue filter fields that hold names, and the collection each name is resolved against
+ISSUE_FILTER_NAME_TARGETS: dict[str, str] = {
+    "assignee": "users",
+    "creator": "users",
+    "project": "projects",
+    "labels": "issueLabels",
+}
+
+
+class _ValidateOnceClient(Client):
+    """gql client that validates each document once per schema instead of on every execute, since every document comes from the get_linear_document registry and is reused"""
+
+    # Sources of the documents validated against each schema, a refreshed schema is a new object and validates them again
+    _validated: weakref.WeakKeyDictionary[GraphQLSchema, set[str]] = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def validate(self, document: DocumentNode) -> None:
+        if not document.loc:
+            super().validate(document)
+            return
+        validated: set[str] = self._validated.setdefault(self.schema, set())
+        if document.loc.source.body not in validated:
+            super().validate(document)
+            validated.add(document.loc.source.body)
 
 
 class LinearClient:
@@ -28,12 +111,63 @@ class LinearClient:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {access_token}",
         }
-        transport = RequestsHTTPTransport(
+        transport = HTTPXAsyncTransport(
             url=LINEAR_API_URL,
             headers=headers,
-            use_json=True,
+            timeout=httpx.Timeout(LINEAR_READ_TIMEOUT, connect=LINEAR_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LINEAR_MAX_CONNECTIONS,
+                max_keepalive_connections=LINEAR_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LINEAR_KEEPALIVE_EXPIRY,
+            ),
+        )
+        schema: Optional[GraphQLSchema] = LINEAR_SCHEMA_CACHE.get()
+        self.client = _ValidateOnceClient(
+            transport=transport,
+            schema=schema,
+            fetch_schema_from_transport=schema is None,
+        )
+        self._session: Optional[AsyncClientSession] = None
+        self._session_lock = asyncio.Lock()
+        # Linear's budgets are per token, and so is this client
+        self._scheduler = LinearRateLimitScheduler()
+        self._metadata: Optional[LinearWorkspaceMetadata] = None
+        self._metadata_lock = asyncio.Lock()
+        # Built from the workspace metadata on first use per collection, and dropped whenever it is reloaded
+        self._name_indexes: dict[str, FuzzyNameIndex] = {}
+        # Issues of this token are mirrored under a hash of it, the token itself is never stored in the mirror
+        self._workspace: str = hashlib.sha256(access_token.encode()).hexdigest()
+        # Kept so that background work can take the cached client of this token when it runs
+        self._access_token: str = access_token
+        # Requests and background work currently using this client, it is only closed once none are left
+        self._leases: int = 0
+        self._evicted: bool = False
+
+    async def execute(
+        self, document: DocumentNode, variable_values: Optional[dict[str, Any]] = None
+    ) -> dict[str, Any]:
+        # The session (and the httpx connection pool behind it) is opened on first use and then kept for the lifetime of the client
+        if not self._session:
+            async with self._session_lock:
+                if not self._session:
+                    self._session = await self.client.connect_async()
+                    if self.client.fetch_schema_from_transport:
+                        # Nothing was cached yet, so this client introspected the schema and every later client reuses it
+                        LINEAR_SCHEMA_CACHE.save(schema=self.client.schema)
+        LINEAR_SCHEMA_CACHE.schedule_refresh(session=self._session)
+        return await self._scheduler.run(
+            call=lambda: self._session.execute(
+                document, variable_values=variable_values
+            ),
+            get_headers=lambda: self.client.transport.response_headers,
+            # Every document comes from the get_linear_document registry, so its source identifies the operation
+            cost_key=document.loc.source.body if document.loc else None,
         )
-        self.client = Client(transport=transport, fetch_schema_from_transport=True)
+
+    async def close(self) -> None:
+        if self._session:
+            await self.client.close_async()
+            self._session = None
 
     def query_grapql(self, query):
         r = requests.post(
@@ -72,67 +206,40 @@ class LinearClient:
     def projects(self):
         return self.query_basic_resource("projects")
 
-    def create_issue(self, request: LinearCreateIssueRequest) -> LinearIssue:
+    async def create_issue(self, request: LinearCreateIssueRequest) -> LinearIssue:
         MUTATION_NAME = "issueCreate"
 
-        mutation = gql(
-            f"""
-            mutation CreateIssue($input: IssueCreateInput!) {{
-                {MUTATION_NAME}(input: $input) {{
-                    success
-                    issue {{
-                        id
-                        number
-                        title
-                        description
-                        priority
-                        estimate
-                        state {{ name }}
-                        assignee {{ name }}
-                        creator {{ name }}
-                        labels {{ nodes {{ name }} }}
-                        createdAt
-                        updatedAt
-                        dueDate
-                        cycle {{ number }}
-                        project {{ name }}
-                        comments {{ nodes {{ body user {{ name }} }} }}
-                        url
-                    }}
-                }}
-            }}
-            """
-        )
+        mutation = get_linear_document(LinearOperation.CREATE_ISSUE)
 
         variables = {
             "input": {
                 "title": request.title,
                 "description": request.description,
                 "stateId": (
-                    self.get_state_id_by_name(name=request.state.value)
+                    await self.get_state_id_by_name(name=request.state.value)
                     if request.state
                     else None
                 ),
                 "priority": request.priority,
                 "assigneeId": (
-                    self.get_id_by_name(name=request.assignee, target="users")
+                    await self.get_id_by_name(name=request.assignee, target="users")
                     if request.assignee
                     else None
                 ),
                 "estimate": request.estimate,
                 "cycleId": (
-                    self.get_id_by_number(number=request.cycle, target="cycles")
+                    await self.get_id_by_number(number=request.cycle, target="cycles")
                     if request.cycle
                     else None
                 ),
                 "labels": request.labels.nodes if request.labels else None,
                 "projectId": (
-                    self.get_id_by_name(name=request.project, target="projects")
+                    await self.get_id_by_name(name=request.project, target="projects")
                     if request.project
                     else None
                 ),
                 "teamId": (
-                    self.get_id_by_name(name="Linear-whale", target="teams")
+                    await self.get_id_by_name(name="Linear-whale", target="teams")
                     if request.assignee
                     else None
                 ),
@@ -143,419 +250,587 @@ class LinearClient:
             k: v for k, v in variables["input"].items() if v is not None
         }
 
-        result = self.client.execute(mutation, variable_values=variables)
-        return LinearIssue.model_validate(
-            _flatten_linear_response_issue(result[MUTATION_NAME]["issue"])
-        )
+        result = await self.execute(mutation, variable_values=variables)
+        created_issue = _flatten_linear_response_issue(result[MUTATION_NAME]["issue"])
+        await self._update_issue_mirror(issues=[created_issue])
+        return created_issue
+
+    async def get_issues(
+        self,
+        request: LinearGetIssuesRequest,
+        max_results: int = LINEAR_MAX_ISSUES,
+        profile: LinearIssueFieldProfile = LinearIssueFieldProfile.FULL,
+    ) -> list[LinearIssue]:
+        """Answers from the issue mirror once it holds a full copy of the workspace, in which case every field is returned regardless of the profile"""
+        request, _ = await self.resolve_filter_names(request=request)
+        if LINEAR_ISSUE_MIRROR:
+            try:
+                if await self.sync_issue_mirror():
+                    return await LINEAR_ISSUE_MIRROR.query(
+                        workspace=self._workspace,
+                        request=request,
+                        max_results=max_results,
+                    )
+            except (SQLAlchemyError, TransportError, httpx.HTTPError) as e:
+                # A broken mirror or a failed sync must not keep reads from being answered live
+                log.warning(f"Linear issue mirror unavailable, querying Linear: {e}")
+        return [
+            issue
+            async for issue in self._iter_issues(
+                request=request, max_results=max_results, profile=profile
+            )
+        ]
 
-    def get_issues(self, request: LinearGetIssuesRequest) -> list[LinearIssue]:
+    async def iter_issues(
+        self,
+        request: LinearGetIssuesRequest,
+        max_results: int = LINEAR_MAX_ISSUES,
+        profile: LinearIssueFieldProfile = LinearIssueFieldProfile.FULL,
+    ) -> AsyncIterator[LinearIssue]:
+        """Yields the issues matching the request one page at a time, stopping after max_results issues. Fields outside the profile are left as None."""
+        request, _ = await self.resolve_filter_names(request=request)
+        async for issue in self._iter_issues(
+            request=request, max_results=max_results, profile=profile
+        ):
+            yield issue
+
+    async def _iter_issues(
+        self,
+        request: LinearGetIssuesRequest,
+        max_results: int,
+        profile: LinearIssueFieldProfile,
+    ) -> AsyncIterator[LinearIssue]:
         match request.use_and_clause:
             case True:
-                return self._get_issues_with_and_clause(request=request)
+                if request.id:
+                    yield await self._get_issue_by_id(
+                        _id=request.id[0], profile=profile
+                    )
+                    return
+                issue_filter: dict = self._get_and_clause_filter(request=request)
             case False:
-                return self._get_issues_with_or_clause(request=request)
+                issue_filter = self._get_or_clause_filter(request=request)
             case _:
                 raise ValueError(
                     "use_and_clause of LinearGetIssuesRequest must be a boolean"
                 )
 
-    def _get_issues_with_or_clause(
-        self, request: LinearGetIssuesRequest
-    ) -> list[LinearIssue]:
-        variables = {}
-        validated_results: list[LinearIssue] = []
         QUERY_OBJ_GROUP: str = "issues"
-        QUERY_OBJ_LIST: str = "nodes"
-        query = gql(
-            f"""
-            query GetIssues($filter: IssueFilter) {{
-                {QUERY_OBJ_GROUP}(filter: $filter) {{
-                    {QUERY_OBJ_LIST}{{
-                        id
-                        number
-                        title
-                        description
-                        priority
-                        estimate
-                        state {{ name }}
-                        assignee {{ name }}
-                        creator {{ name }}
-                        labels {{ nodes {{ name }} }}
-                        createdAt
-                        updatedAt
-                        dueDate
-                        cycle {{ number }}
-                        project {{ name }}
-                        comments {{ nodes {{ body user {{ name }} }} }}
-                        url
-                    }}
-                }}
-            }}
-        """
-        )
-        variables["filter"] = {"or": []}
-        if request.id:
-            variables["filter"]["or"].extend(
-                [{"id": {"eq": _id}} for _id in request.id]
+        query = get_linear_document(LinearOperation.GET_ISSUES, profile=profile)
+        remaining: int = max_results
+        cursor: Optional[str] = None
+        while remaining > 0:
+            result = await self.execute(
+                query,
+                variable_values={
+                    "filter": issue_filter,
+                    "first": min(LINEAR_ISSUES_PAGE_SIZES[profile], remaining),
+                    "after": cursor,
+                },
             )
+            page: dict = result[QUERY_OBJ_GROUP]
+            for issue in page["nodes"]:
+                yield _flatten_linear_response_issue(issue)
+            remaining -= len(page["nodes"])
+            if not page["pageInfo"]["hasNextPage"]:
+                return
+            cursor = page["pageInfo"]["endCursor"]
+        log.warning(f"Stopped retrieving Linear issues after {max_results} results")
+
+    async def _get_issue_by_id(
+        self, _id: str, profile: LinearIssueFieldProfile
+    ) -> LinearIssue:
+        QUERY_OBJ_NAME: str = "issue"
+        query = get_linear_document(LinearOperation.GET_ISSUE, profile=profile)
+        result = await self.execute(query, variable_values={"id": _id})
+        return _flatten_linear_response_issue(result[QUERY_OBJ_NAME])
+
+    def _get_or_clause_filter(self, request: LinearGetIssuesRequest) -> dict:
+        issue_filter = {"or": []}
+        if request.id:
+            issue_filter["or"].extend([{"id": {"eq": _id}} for _id in request.id])
         if request.state:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [{"state": {"name": {"eq": _state}}} for _state in request.state]
             )
         if request.number:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [{"number": {"eq": _number}} for _number in request.number]
             )
         if request.title:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [{"title": {"contains": _title}} for _title in request.title]
             )
         if request.assignee:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [
                     {"assignee": {"name": {"eq": _assignee}}}
                     for _assignee in request.assignee
                 ]
             )
         if request.creator:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [
                     {"creator": {"name": {"eq": _creator}}}
                     for _creator in request.creator
                 ]
             )
         if request.project:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [
                     {"project": {"name": {"eq": _project}}}
                     for _project in request.project
                 ]
             )
         if request.cycle:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [{"cycle": {"number": {"eq": _cycle}}} for _cycle in request.cycle]
             )
         if request.labels:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [
                     {"labels": {"some": {"name": {"in": _labels}}}}
                     for _labels in request.labels
                 ]
             )
         if request.estimate:
-            variables["filter"]["or"].extend(
+            issue_filter["or"].extend(
                 [{"estimate": {"eq": _estimate}} for _estimate in request.estimate]
             )
-        result = self.client.execute(query, variable_values=variables)
+        return issue_filter
 
-        for issue in result[QUERY_OBJ_GROUP][QUERY_OBJ_LIST]:
-            validated_results.append(_flatten_linear_response_issue(issue))
-        return validated_results
-
-    def _get_issues_with_and_clause(
-        self, request: LinearGetIssuesRequest
-    ) -> list[LinearIssue]:
-        variables = {}
-        validated_results: list[LinearIssue] = []
-
-        if request.id:
-            QUERY_OBJ_NAME: str = "issue"
-            query = gql(
-                f"""
-                query GetIssue($id: String!) {{
-                    {QUERY_OBJ_NAME}(id: $id) {{
-                        id
-                        number
-                        title
-                        description
-                        priority
-                        estimate
-                        state {{ name }}
-                        assignee {{ name }}
-                        creator {{ name }}
-                        labels {{ nodes {{ name }} }}
-                        createdAt
-                        updatedAt
-                        dueDate
-                        cycle {{ number }}
-                        project {{ name }}
-                        comments {{ nodes {{ body user {{ name }} }} }}
-                        url
-                    }}
-                }}
-            """
+    def _get_and_clause_filter(self, request: LinearGetIssuesRequest) -> dict:
+        issue_filter = {"and": []}
+        if request.state:
+            issue_filter["and"].append({"state": {"name": {"eq": request.state[0]}}})
+        if request.number:
+            issue_filter["and"].append({"number": {"eq": request.number[0]}})
+        if request.title:
+            issue_filter["and"].append({"title": {"contains": request.title[0]}})
+        if request.assignee:
+            issue_filter["and"].append(
+                {"assignee": {"name": {"eq": request.assignee[0]}}}
             )
-            variables["id"] = request.id[0]
-            result = self.client.execute(query, variable_values=variables)
-            validated_results.append(
-                _flatten_linear_response_issue(result[QUERY_OBJ_NAME])
+        if request.creator:
+            issue_filter["and"].append(
+                {"creator": {"name": {"eq": request.creator[0]}}}
             )
-        else:
-            QUERY_OBJ_GROUP: str = "issues"
-            QUERY_OBJ_LIST: str = "nodes"
-            query = gql(
-                f"""
-                query GetIssues($filter: IssueFilter) {{
-                    {QUERY_OBJ_GROUP}(filter: $filter) {{
-                        {QUERY_OBJ_LIST}{{
-                            id
-                            number
-                            title
-                            description
-                            priority
-                            estimate
-                            state {{ name }}
-                            assignee {{ name }}
-                            creator {{ name }}
-                            labels {{ nodes {{ name }} }}
-                            createdAt
-                            updatedAt
-                            dueDate
-                            cycle {{ number }}
-                            project {{ name }}
-                            comments {{ nodes {{ body user {{ name }} }} }}
-                            url
-                        }}
-                    }}
-                }}
-            """
+        if request.project:
+            issue_filter["and"].append(
+                {"project": {"name": {"eq": request.project[0]}}}
             )
-            variables["filter"] = {"and": []}
-            if request.state:
-                variables["filter"]["and"].append(
-                    {"state": {"name": {"eq": request.state[0]}}}
-                )
-            if request.number:
-                variables["filter"]["and"].append({"number": {"eq": request.number[0]}})
-            if request.title:
-                variables["filter"]["and"].append(
-                    {"title": {"contains": request.title[0]}}
-                )
-            if request.assignee:
-                variables["filter"]["and"].append(
-                    {"assignee": {"name": {"eq": request.assignee[0]}}}
-                )
-            if request.creator:
-                variables["filter"]["and"].append(
-                    {"creator": {"name": {"eq": request.creator[0]}}}
-                )
-            if request.project:
-                variables["filter"]["and"].append(
-                    {"project": {"name": {"eq": request.project[0]}}}
-                )
-            if request.cycle:
-                variables["filter"]["and"].append(
-                    {"cycle": {"number": {"eq": request.cycle[0]}}}
-                )
-            if request.labels:
-                variables["filter"]["and"].append(
-                    {"labels": {"some": {"name": {"in": request.labels}}}}
-                )
-            if request.estimate:
-                variables["filter"]["and"].append(
-                    {"estimate": {"eq": request.estimate[0]}}
-                )
-            result = self.client.execute(query, variable_values=variables)
-            for issue in result[QUERY_OBJ_GROUP][QUERY_OBJ_LIST]:
-                validated_results.append(_flatten_linear_response_issue(issue))
-
-        return validated_results
+        if request.cycle:
+            issue_filter["and"].append({"cycle": {"number": {"eq": request.cycle[0]}}})
+        if request.labels:
+            issue_filter["and"].append(
+                {"labels": {"some": {"name": {"in": request.labels}}}}
+            )
+        if request.estimate:
+            issue_filter["and"].append({"estimate": {"eq": request.estimate[0]}})
+        return issue_filter
 
-    def update_issues(self, request: LinearUpdateIssuesRequest) -> list[LinearIssue]:
-        variables = {}
+    async def update_issues(
+        self, request: LinearUpdateIssuesRequest
+    ) -> LinearBulkResult:
         validated_results: list[LinearIssue] = []
 
         # First, get the issues based on filter_conditions
         filter_conditions = request.filter_conditions
-        issues_to_update = self.get_issues(filter_conditions)
-
-        # Prepare the update mutation
-        MUTATION_NAME: str = "issueUpdate"
-        mutation = gql(
-            f"""
-            mutation UpdateIssue($id: String!, $update: IssueUpdateInput!) {{
-                {MUTATION_NAME}(id: $id, input: $update) {{
-                    success
-                    issue {{
-                        id
-                        number
-                        title
-                        description
-                        priority
-                        estimate
-                        state {{ name }}
-                        assignee {{ name }}
-                        creator {{ name }}
-                        labels {{ nodes {{ name }} }}
-                        createdAt
-                        updatedAt
-                        dueDate
-                        cycle {{ number }}
-                        project {{ name }}
-                        comments {{ nodes {{ body user {{ name }} }} }}
-                        url
-                    }}
-                }}
-            }}
-            """
+        # Only the ids are needed to update the issues, the mutations return the full updated issues
+        issues_to_update, truncated = await self._get_bulk_issues(
+            request=filter_conditions, profile=LinearIssueFieldProfile.IDS
         )
 
-        # Iterate over each issue and apply the updates
-        for issue in issues_to_update:
-            variables["id"] = issue.id
-            variables["update"] = {}
-
-            update_conditions = request.update_conditions
-
-            if update_conditions.state:
-                variables["update"]["stateId"] = self.get_state_id_by_name(
-                    update_conditions.state.value
-                )
-            if update_conditions.assignee:
-                variables["update"]["assigneeId"] = self.get_id_by_name(
-                    update_conditions.assignee, "users"
-                )
-            if update_conditions.project:
-                variables["update"]["projectId"] = self.get_id_by_name(
-                    update_conditions.project, "projects"
-                )
-            if update_conditions.cycle:
-                variables["update"]["cycleId"] = self.get_id_by_number(
-                    update_conditions.cycle, "cycles"
+        # The update is the same for every issue, so its ids are resolved once up front
+        update_conditions = request.update_conditions
+        update: dict = {}
+        if update_conditions.state:
+            update["stateId"] = await self.get_state_id_by_name(
+                update_conditions.state.value
+            )
+        if update_conditions.assignee:
+            update["assigneeId"] = await self.get_id_by_name(
+                update_conditions.assignee, "users"
+            )
+        if update_conditions.project:
+            update["projectId"] = await self.get_id_by_name(
+                update_conditions.project, "projects"
+            )
+        if update_conditions.cycle:
+            update["cycleId"] = await self.get_id_by_number(
+                update_conditions.cycle, "cycles"
+            )
+        if update_conditions.labels:
+            label_names = [label.name for label in update_conditions.labels.nodes]
+            update["labelIds"] = [
+                await self.get_label_id_by_name(label) for label in label_names
+            ]
+        if update_conditions.estimate:
+            update["estimate"] = update_conditions.estimate
+
+        # Issues are updated in batches of aliased mutations, one request per batch instead of one per issue
+        failed_ids: list[str] = []
+        try:
+            for batch in batches(issues_to_update, size=LINEAR_MUTATION_BATCH_SIZE):
+                mutation = get_linear_document(
+                    LinearOperation.UPDATE_ISSUES, variant=len(batch)
                 )
-            if update_conditions.labels:
-                label_names = [label.name for label in update_conditions.labels.nodes]
-                variables["update"]["labelIds"] = [
-                    self.get_label_id_by_name(label) for label in label_names
-                ]
-            if update_conditions.estimate:
-                variables["update"]["estimate"] = update_conditions.estimate
+                variables = {f"id{idx}": issue.id for idx, issue in enumerate(batch)}
+                variables["update"] = update
+                result = await self._execute_batch(mutation, variables=variables)
+
+                for idx, issue in enumerate(batch):
+                    outcome: Optional[dict] = result.get(f"issue{idx}")
+                    if outcome and outcome.get("success"):
+                        validated_results.append(
+                            _flatten_linear_response_issue(outcome["issue"])
+                        )
+                    else:
+                        failed_ids.append(issue.id)
+        finally:
+            # Writes that landed before a batch raised are still mirrored
+            await self._update_issue_mirror(issues=validated_results)
+        return LinearBulkResult(
+            issues=validated_results[:LINEAR_MAX_ISSUES],
+            count=len(validated_results),
+            truncated=truncated,
+            failed_ids=failed_ids,
+        )
 
-            result = self.client.execute(mutation, variable_values=variables)
+    async def delete_issues(
+        self, request: LinearDeleteIssuesRequest
+    ) -> LinearBulkResult:
+        # Deleted issues can no longer be queried, so enough of them is kept to tell the user what was deleted
+        issues_to_delete, truncated = await self._get_bulk_issues(
+            request=request, profile=LinearIssueFieldProfile.SUMMARY
+        )
 
-            validated_results.append(
-                _flatten_linear_response_issue(result[MUTATION_NAME]["issue"])
+        deleted_issues: list[LinearIssue] = []
+        failed_ids: list[str] = []
+        try:
+            for batch in batches(issues_to_delete, size=LINEAR_MUTATION_BATCH_SIZE):
+                mutation = get_linear_document(
+                    LinearOperation.DELETE_ISSUES, variant=len(batch)
+                )
+                variables = {f"id{idx}": issue.id for idx, issue in enumerate(batch)}
+                result = await self._execute_batch(mutation, variables=variables)
+
+                for idx, issue in enumerate(batch):
+                    outcome: Optional[dict] = result.get(f"issue{idx}")
+                    if outcome and outcome.get("success"):
+                        deleted_issues.append(issue)
+                    else:
+                        failed_ids.append(issue.id)
+        finally:
+            # Deletes that landed before a batch raised are still mirrored
+            await self._update_issue_mirror(
+                deleted_ids=[issue.id for issue in deleted_issues]
             )
-
-        return validated_results
-
-    def delete_issues(self, request: LinearDeleteIssuesRequest) -> list[LinearIssue]:
-        variables = {}
-        issues_to_delete = self.get_issues(request=request)
-
-        MUTATION_NAME: str = "issueDelete"
-        mutation = gql(
-            f"""
-            mutation DeleteIssue($id: String!) {{
-                {MUTATION_NAME}(id: $id) {{
-                    success
-                }}
-            }}
-            """
+        return LinearBulkResult(
+            issues=deleted_issues[:LINEAR_MAX_ISSUES],
+            count=len(deleted_issues),
+            truncated=truncated,
+            failed_ids=failed_ids,
         )
 
-        for issue in issues_to_delete:
-            variables["id"] = issue.id
-            self.client.execute(mutation, variable_values=variables)
+    async def _execute_batch(
+        self, mutation: DocumentNode, variables: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Runs a batch of aliased mutations and returns the aliases that were applied, a failed alias is missing or null"""
+        try:
+            return await self.execute(mutation, variable_values=variables)
+        except TransportQueryError as e:
+            # Linear still applies the other aliases of the batch when one of them fails, so their results are kept
+            log.warning(f"Some Linear mutations in a batch failed: {e.errors}")
+            return e.data or {}
+
+    async def _get_bulk_issues(
+        self, request: LinearFilterIssuesRequest, profile: LinearIssueFieldProfile
+    ) -> tuple[list[LinearIssue], bool]:
+        """Lists every issue an update or delete applies to, at most LINEAR_BULK_MAX_ISSUES, and whether the filter matched more than that"""
+        # One more issue than allowed is listed to tell whether the filter matched more
+        issues: list[LinearIssue] = await self.get_issues(
+            request=request, max_results=LINEAR_BULK_MAX_ISSUES + 1, profile=profile
+        )
+        truncated: bool = len(issues) > LINEAR_BULK_MAX_ISSUES
+        if truncated:
+            log.warning(
+                f"Linear filter matched more than {LINEAR_BULK_MAX_ISSUES} issues, only the first are affected"
+            )
+        return issues[:LINEAR_BULK_MAX_ISSUES], truncated
 
-        return issues_to_delete
+    ###
+    ### Issue mirror
+    ###
+    async def sync_issue_mirror(self) -> bool:
+        """Brings the mirror up to date at most once every LINEAR_MIRROR_SYNC_INTERVAL_SECONDS, returning False while its first full copy of the workspace is still running"""
+        if LINEAR_ISSUE_MIRROR.is_fresh(workspace=self._workspace):
+            return True
+        sync_state: Optional[LinearIssueSyncORM] = (
+            await LINEAR_ISSUE_MIRROR.get_sync_state(workspace=self._workspace)
+        )
+        if not sync_state or sync_state.updated_at is None:
+            # Copying every issue of a large workspace can take longer than a request may, so it runs in the background and reads go to Linear until it finishes
+            LINEAR_ISSUE_MIRROR.start_backfill(
+                workspace=self._workspace,
+                backfill=lambda: _backfill_issue_mirror(
+                    access_token=self._access_token
+                ),
+            )
+            return False
+        await self._sync_issues()
+        return True
+
+    async def _sync_issues(self) -> None:
+        """Copies the issues updated since the last finished sync into the mirror, checkpointing after every page"""
+        async with LINEAR_ISSUE_MIRROR.sync_lock(workspace=self._workspace):
+            if LINEAR_ISSUE_MIRROR.is_fresh(workspace=self._workspace):
+                return
+            sync_state: LinearIssueSyncORM = await LINEAR_ISSUE_MIRROR.get_sync_state(
+                workspace=self._workspace
+            ) or LinearIssueSyncORM(workspace=self._workspace)
+            # The first sync of a workspace copies all of its issues
+            issue_filter: Optional[dict] = (
+                {"updatedAt": {"gt": sync_state.updated_at}}
+                if sync_state.updated_at is not None
+                else None
+            )
+            query = get_linear_document(LinearOperation.SYNC_ISSUES)
+            # An interrupted sync resumes from its checkpoint
+            cursor: Optional[str] = sync_state.cursor
+            watermark: Optional[str] = sync_state.pending_updated_at
+            # Recorded instead of a watermark if the workspace has no issues yet, since the filter needs a valid DateTime
+            started_at: str = (
+                datetime.now(timezone.utc)
+                .isoformat(timespec="milliseconds")
+                .replace("+00:00", "Z")
+            )
+            while True:
+                result = await self.execute(
+                    query,
+                    variable_values={
+                        "filter": issue_filter,
+                        "first": LINEAR_ISSUES_PAGE_SIZE,
+                        "after": cursor,
+                    },
+                )
+                page: dict = result["issues"]
+                updated_issues: list[LinearIssue] = []
+                deleted_ids: list[str] = []
+                for issue in page["nodes"]:
+                    watermark = max(watermark or "", issue["updatedAt"])
+                    # Archived and deleted issues are left out of the API's results, so they are dropped from the mirror too
+                    if issue.pop("archivedAt"):
+                        deleted_ids.append(issue["id"])
+                    else:
+                        updated_issues.append(_flatten_linear_response_issue(issue))
+                # Pages are ordered by updatedAt, so an issue updated after its page was copied moves past the cursor or above the watermark, and is copied again by this or the next sync
+                finished: bool = not page["pageInfo"]["hasNextPage"]
+                cursor = None if finished else page["pageInfo"]["endCursor"]
+                await LINEAR_ISSUE_MIRROR.write(
+                    workspace=self._workspace,
+                    issues=updated_issues,
+                    deleted_ids=deleted_ids,
+                    sync_state=LinearIssueSyncORM(
+                        workspace=self._workspace,
+                        updated_at=(
+                            (watermark or sync_state.updated_at or started_at)
+                            if finished
+                            else sync_state.updated_at
+                        ),
+                        cursor=cursor,
+                        pending_updated_at=None if finished else watermark,
+                    ),
+                )
+                if finished:
+                    return
+
+    async def _update_issue_mirror(
+        self, issues: list[LinearIssue] = [], deleted_ids: list[str] = []
+    ) -> None:
+        """Writes the result of a mutation through to the mirror, a failure only means the next read syncs first"""
+        if not LINEAR_ISSUE_MIRROR:
+            return
+        try:
+            await LINEAR_ISSUE_MIRROR.write(
+                workspace=self._workspace, issues=issues, deleted_ids=deleted_ids
+            )
+        except SQLAlchemyError as e:
+            log.warning(f"Failed to mirror Linear issue changes: {e}")
+            LINEAR_ISSUE_MIRROR.expire(workspace=self._workspace)
 
     ###
     ### Helper
     ###
-    def get_id_by_name(self, name: str, target: str) -> str:
-        query = gql(
-            f"""
-            query GetIdByName($name: String!) {{
-                {target}(filter: {{ name: {{ eq: $name }} }}) {{
-                    nodes {{
-                        id
-                    }}
-                }}
-            }}
-            """
+    async def get_workspace_metadata(self) -> LinearWorkspaceMetadata:
+        """Returns the name to id maps of the workspace, reloading all of them in a single query once they are older than LINEAR_METADATA_TTL_SECONDS"""
+        if not self._is_workspace_metadata_fresh():
+            async with self._metadata_lock:
+                if not self._is_workspace_metadata_fresh():
+                    result = await self.execute(
+                        get_linear_document(LinearOperation.GET_WORKSPACE_METADATA)
+                    )
+                    self._metadata = LinearWorkspaceMetadata(
+                        ids_by_name={
+                            target: _index_nodes(result[target]["nodes"], key="name")
+                            for target in WORKSPACE_TARGETS_BY_NAME
+                        },
+                        ids_by_number={
+                            target: _index_nodes(result[target]["nodes"], key="number")
+                            for target in WORKSPACE_TARGETS_BY_NUMBER
+                        },
+                        loaded_at=time.monotonic(),
+                    )
+                    self._name_indexes = {}
+        return self._metadata
+
+    def invalidate_workspace_metadata(self) -> None:
+        self._metadata = None
+        self._name_indexes = {}
+
+    def _is_workspace_metadata_fresh(self) -> bool:
+        return bool(
+            self._metadata
+            and time.monotonic() - self._metadata.loaded_at
+            < LINEAR_METADATA_TTL_SECONDS
         )
 
+    async def resolve_name(
+        self, name: str, target: str, allow_substitution: bool = False
+    ) -> str:
+        """Returns the name in the workspace that a misspelled or differently capitalised name refers to, or the name itself if none is close. Raises AmbiguousNameError if several are equally close, and UnconfirmedNameError for a different name unless substitutions are allowed."""
+        metadata: LinearWorkspaceMetadata = await self.get_workspace_metadata()
+        if name in metadata.ids_by_name[target]:
+            return name
+        if target not in self._name_indexes:
+            self._name_indexes[target] = FuzzyNameIndex(metadata.ids_by_name[target])
+        resolved: Optional[str] = self._name_indexes[target].resolve(name)
+        if resolved and is_same_name(name, resolved):
+            return resolved
+        # The cached maps miss names beyond their first page or created since they were loaded, so the exact name is looked up before settling for a different one
+        if await self._fetch_id_by_name(name=name, target=target):
+            return name
+        if not resolved:
+            return name
+        if not allow_substitution:
+            raise UnconfirmedNameError(name=name, match=resolved)
+        log.info(f"Resolved {target} '{name}' to '{resolved}'")
+        return resolved
+
+    async def resolve_filter_names(
+        self, request: LinearFilterIssuesRequest, allow_substitutions: bool = False
+    ) -> tuple[LinearFilterIssuesRequest, dict[str, str]]:
+        """Resolves the names in an issue filter, returning the resolved request and the names that were replaced by different ones"""
+        update: dict[str, list[str]] = {}
+        substitutions: dict[str, str] = {}
+        for field, target in ISSUE_FILTER_NAME_TARGETS.items():
+            if not (names := getattr(request, field)):
+                continue
+            update[field] = [
+                await self.resolve_name(
+                    name=name, target=target, allow_substitution=allow_substitutions
+                )
+                for name in names
+            ]
+            substitutions |= {
+                name: resolved
+                for name, resolved in zip(names, update[field])
+                if not is_same_name(name, resolved)
+            }
+        return (request.model_copy(update=update) if update else request), substitutions
+
+    async def get_id_by_name(self, name: str, target: str) -> str:
+        # Only used to write issues, so a different name than the one given is never used without the user confirming it
+        resolved: str = await self.resolve_name(name=name, target=target)
+        metadata: LinearWorkspaceMetadata = await self.get_workspace_metadata()
+        if resolved in metadata.ids_by_name[target]:
+            return metadata.ids_by_name[target][resolved]
+        raise ValueError(f"{target} with name '{name}' not found.")
+
+    async def _fetch_id_by_name(self, name: str, target: str) -> Optional[str]:
+        """Asks the API for the id of an exact name missing from the cached maps, and remembers the answer"""
+        query = get_linear_document(LinearOperation.GET_ID_BY_NAME, variant=target)
+
         variables = {"name": name}
 
-        result = self.client.execute(query, variable_values=variables)
-        users = result.get(target, {}).get("nodes", [])
+        result = await self.execute(query, variable_values=variables)
+        nodes = result.get(target, {}).get("nodes", [])
 
-        if users:
-            return users[0]["id"]
-        else:
-            raise ValueError(f"{target} with name '{name}' not found.")
-
-    def get_id_by_number(self, number: int, target: str) -> str:
-        query = gql(
-            f"""
-            query GetIdByNumber($number: Float!) {{
-                {target}(filter: {{ number: {{ eq: $number }} }}) {{
-                    nodes {{
-                        id
-                    }}
-                }}
-            }}
-            """
-        )
+        if not nodes:
+            return None
+        metadata: LinearWorkspaceMetadata = await self.get_workspace_metadata()
+        metadata.ids_by_name[target][name] = nodes[0]["id"]
+        self._name_indexes.pop(target, None)
+        return nodes[0]["id"]
+
+    async def get_id_by_number(self, number: int, target: str) -> str:
+        metadata: LinearWorkspaceMetadata = await self.get_workspace_metadata()
+        if number in metadata.ids_by_number[target]:
+            return metadata.ids_by_number[target][number]
+
+        query = get_linear_document(LinearOperation.GET_ID_BY_NUMBER, variant=target)
 
         variables = {"number": number}
 
-        result = self.client.execute(query, variable_values=variables)
-        cycles = result.get(target, {}).get("nodes", [])
+        result = await self.execute(query, variable_values=variables)
+        nodes = result.get(target, {}).get("nodes", [])
 
-        if cycles:
-            return cycles[0]["id"]
+        if nodes:
+            metadata.ids_by_number[target][number] = nodes[0]["id"]
+            return nodes[0]["id"]
         else:
             raise ValueError(f"Cycle with number '{number}' not found.")
 
-    def get_state_id_by_name(self, name: str) -> str:
-        query = gql(
-            """
-            query GetStateIdByName {
-                workflowStates {
-                    nodes {
-                        id
-                        name
-                    }
-                }
-            }
-            """
-        )
+    async def get_state_id_by_name(self, name: str) -> str:
+        return await self.get_id_by_name(name=name, target="workflowStates")
 
-        result = self.client.execute(query)
-        states = result.get("workflowStates", {}).get("nodes", [])
+    async def get_label_id_by_name(self, name: str) -> str:
+        return await self.get_id_by_name(name=name, target="issueLabels")
 
-        # Filter the states by name in the application code
-        for state in states:
-            if state["name"] == name:
-                return state["id"]
 
-        raise ValueError(f"State with name '{name}' not found.")
+_linear_clients: OrderedDict[str, LinearClient] = OrderedDict()
 
-    def get_label_id_by_name(self, name: str) -> str:
-        query = gql(
-            """
-            query GetLabelIdByName {
-                issueLabels {
-                    nodes {
-                        id
-                        name
-                    }
-                }
-            }
-            """
-        )
 
-        result = self.client.execute(query)
-        labels = result.get("issueLabels", {}).get("nodes", [])
+@asynccontextmanager
+async def get_linear_client(access_token: str) -> AsyncIterator[LinearClient]:
+    """Leases the LinearClient shared by every request made with this access token, so consecutive agent hops reuse its warm connections instead of opening new ones."""
+    client: Optional[LinearClient] = _linear_clients.pop(access_token, None)
+    if not client:
+        client = LinearClient(access_token=access_token)
+    _linear_clients[access_token] = client
+    client._leases += 1
+    try:
+        while len(_linear_clients) > LINEAR_CLIENT_CACHE_SIZE:
+            # The least recently used client still holds a session and connection pool, which are closed once nothing is using it anymore
+            _, evicted = _linear_clients.popitem(last=False)
+            evicted._evicted = True
+            if not evicted._leases:
+                await _close_linear_client(client=evicted)
+        yield client
+    finally:
+        client._leases -= 1
+        if client._evicted and not client._leases:
+            await _close_linear_client(client=client)
 
-        # Filter the labels by name in the application code
-        for label in labels:
-            if label["name"] == name:
-                return label["id"]
 
-        raise ValueError(f"Label with name '{name}' not found.")
+async def close_linear_clients() -> None:
+    """Closes every cached LinearClient, called when the app shuts down"""
+    while _linear_clients:
+        _, client = _linear_clients.popitem()
+        await _close_linear_client(client=client)
+
+
+async def _close_linear_client(client: LinearClient) -> None:
+    try:
+        await client.close()
+    except Exception as e:
+        log.warning(f"Failed to close Linear client: {e}")
+
+
+async def _backfill_issue_mirror(access_token: str) -> None:
+    # The backfill can outlive the request that started it, so it leases the cached client itself instead of keeping that request's one
+    async with get_linear_client(access_token=access_token) as client:
+        await client._sync_issues()
 
 
 def _flatten_linear_response_issue(issue: dict) -> LinearIssue:
@@ -578,3 +853,11 @@ def _flatten_linear_response_issue(issue: dict) -> LinearIssue:
         issue["creator"] = issue["creator"]["name"]
 
     return LinearIssue.model_validate(issue)
+
+
+def _index_nodes(nodes: list[dict], key: str) -> dict:
+    index: dict = {}
+    for node in nodes:
+        # Names can repeat across teams (e.g. every team has a "Todo" state), the first match wins as before
+        index.setdefault(int(node[key]) if key == "number" else node[key], node["id"])
+    return index
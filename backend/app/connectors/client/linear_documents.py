@@ -0,0 +1,205 @@
+from enum import StrEnum
+from functools import lru_cache
+from typing import Callable, Optional, Union
+
+from gql import gql
+from graphql import DocumentNode
+
+from app.models.integrations.linear import LinearIssueFieldProfile
+
+# Largest page Linear allows, anything beyond it is looked up on demand
+LINEAR_METADATA_PAGE_SIZE = 250
+WORKSPACE_TARGETS_BY_NAME = (
+    "users",
+    "projects",
+    "teams",
+    "workflowStates",
+    "issueLabels",
+)
+WORKSPACE_TARGETS_BY_NUMBER = ("cycles",)
+# Fields selected for each issue profile, queries only pay the complexity cost of what their callers need
+ISSUE_FIELD_PROFILES: dict[LinearIssueFieldProfile, tuple[str, ...]] = {
+    LinearIssueFieldProfile.IDS: ("id", "number"),
+    LinearIssueFieldProfile.SUMMARY: (
+        "id",
+        "number",
+        "title",
+        "priority",
+        "estimate",
+        "state { name }",
+        "assignee { name }",
+        "labels { nodes { name } }",
+        "dueDate",
+        "cycle { number }",
+        "project { name }",
+        "url",
+    ),
+    LinearIssueFieldProfile.FULL: (
+        "id",
+        "number",
+        "title",
+        "description",
+        "priority",
+        "estimate",
+        "state { name }",
+        "assignee { name }",
+        "creator { name }",
+        "labels { nodes { name } }",
+        "createdAt",
+        "updatedAt",
+        "dueDate",
+        "cycle { number }",
+        "project { name }",
+        "comments { nodes { body user { name } } }",
+        "url",
+    ),
+}
+ISSUE_SELECTIONS: dict[LinearIssueFieldProfile, str] = {
+    profile: " ".join(fields) for profile, fields in ISSUE_FIELD_PROFILES.items()
+}
+
+
+class LinearOperation(StrEnum):
+    CREATE_ISSUE = "CreateIssue"
+    GET_ISSUE = "GetIssue"
+    GET_ISSUES = "GetIssues"
+    # Includes archived (and deleted) issues so that the issue mirror can drop them
+    SYNC_ISSUES = "SyncIssues"
+    # The batched mutations take the batch size as their variant
+    UPDATE_ISSUES = "UpdateIssues"
+    DELETE_ISSUES = "DeleteIssues"
+    GET_WORKSPACE_METADATA = "GetWorkspaceMetadata"
+    # The id lookups take the collection to look in (e.g. "users") as their variant
+    GET_ID_BY_NAME = "GetIdByName"
+    GET_ID_BY_NUMBER = "GetIdByNumber"
+
+
+def _create_issue(profile: LinearIssueFieldProfile, variant: None) -> str:
+    return f"""
+        mutation CreateIssue($input: IssueCreateInput!) {{
+            issueCreate(input: $input) {{
+                success
+                issue {{ {ISSUE_SELECTIONS[profile]} }}
+            }}
+        }}
+    """
+
+
+def _get_issue(profile: LinearIssueFieldProfile, variant: None) -> str:
+    return f"""
+        query GetIssue($id: String!) {{
+            issue(id: $id) {{ {ISSUE_SELECTIONS[profile]} }}
+        }}
+    """
+
+
+def _get_issues(profile: LinearIssueFieldProfile, variant: None) -> str:
+    return f"""
+        query GetIssues($filter: IssueFilter, $first: Int, $after: String) {{
+            issues(filter: $filter, first: $first, after: $after) {{
+                nodes {{ {ISSUE_SELECTIONS[profile]} }}
+                pageInfo {{ hasNextPage endCursor }}
+            }}
+        }}
+    """
+
+
+def _sync_issues(profile: LinearIssueFieldProfile, variant: None) -> str:
+    return f"""
+        query SyncIssues($filter: IssueFilter, $first: Int, $after: String) {{
+            issues(filter: $filter, first: $first, after: $after, orderBy: updatedAt, includeArchived: true) {{
+                nodes {{ {ISSUE_SELECTIONS[profile]} archivedAt }}
+                pageInfo {{ hasNextPage endCursor }}
+            }}
+        }}
+    """
+
+
+def _update_issues(profile: LinearIssueFieldProfile, variant: int) -> str:
+    id_params: str = ", ".join(f"$id{idx}: String!" for idx in range(variant))
+    aliased_mutations: str = "\n".join(
+        f"issue{idx}: issueUpdate(id: $id{idx}, input: $update) {{ success issue {{ {ISSUE_SELECTIONS[profile]} }} }}"
+        for idx in range(variant)
+    )
+    return f"""
+        mutation UpdateIssues($update: IssueUpdateInput!, {id_params}) {{
+            {aliased_mutations}
+        }}
+    """
+
+
+def _delete_issues(profile: LinearIssueFieldProfile, variant: int) -> str:
+    id_params: str = ", ".join(f"$id{idx}: String!" for idx in range(variant))
+    aliased_mutations: str = "\n".join(
+        f"issue{idx}: issueDelete(id: $id{idx}) {{ success }}" for idx in range(variant)
+    )
+    return f"""
+        mutation DeleteIssues({id_params}) {{
+            {aliased_mutations}
+        }}
+    """
+
+
+def _get_workspace_metadata(profile: LinearIssueFieldProfile, variant: None) -> str:
+    selections: str = " ".join(
+        [
+            f"{target}(first: {LINEAR_METADATA_PAGE_SIZE}) {{ nodes {{ id name }} }}"
+            for target in WORKSPACE_TARGETS_BY_NAME
+        ]
+        + [
+            f"{target}(first: {LINEAR_METADATA_PAGE_SIZE}) {{ nodes {{ id number }} }}"
+            for target in WORKSPACE_TARGETS_BY_NUMBER
+        ]
+    )
+    return f"""
+        query GetWorkspaceMetadata {{
+            {selections}
+        }}
+    """
+
+
+def _get_id_by_name(profile: LinearIssueFieldProfile, variant: str) -> str:
+    return f"""
+        query GetIdByName($name: String!) {{
+            {variant}(filter: {{ name: {{ eq: $name }} }}) {{
+                nodes {{
+                    id
+                }}
+            }}
+        }}
+    """
+
+
+def _get_id_by_number(profile: LinearIssueFieldProfile, variant: str) -> str:
+    return f"""
+        query GetIdByNumber($number: Float!) {{
+            {variant}(filter: {{ number: {{ eq: $number }} }}) {{
+                nodes {{
+                    id
+                }}
+            }}
+        }}
+    """
+
+
+LINEAR_DOCUMENT_SOURCES: dict[LinearOperation, Callable[..., str]] = {
+    LinearOperation.CREATE_ISSUE: _create_issue,
+    LinearOperation.GET_ISSUE: _get_issue,
+    LinearOperation.GET_ISSUES: _get_issues,
+    LinearOperation.SYNC_ISSUES: _sync_issues,
+    LinearOperation.UPDATE_ISSUES: _update_issues,
+    LinearOperation.DELETE_ISSUES: _delete_issues,
+    LinearOperation.GET_WORKSPACE_METADATA: _get_workspace_metadata,
+    LinearOperation.GET_ID_BY_NAME: _get_id_by_name,
+    LinearOperation.GET_ID_BY_NUMBER: _get_id_by_number,
+}
+
+
+@lru_cache(maxsize=None)
+def get_linear_document(
+    operation: LinearOperation,
+    profile: LinearIssueFieldProfile = LinearIssueFieldProfile.FULL,
+    variant: Optional[Union[int, str]] = None,
+) -> DocumentNode:
+    """Returns the parsed document of an operation, which is only parsed the first time it is asked for and then reused by every request in the process"""
+    return gql(LINEAR_DOCUMENT_SOURCES[operation](profile=profile, variant=variant))
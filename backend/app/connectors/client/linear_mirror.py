@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import ColumnElement, and_, delete, exists, or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.connectors.native.stores.linear_issue import (
+    Base,
+    LinearIssueLabelORM,
+    LinearIssueORM,
+    LinearIssueSyncORM,
+)
+from app.models.integrations.linear import LinearFilterIssuesRequest, LinearIssue
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+# e.g. postgresql+asyncpg://... or sqlite+aiosqlite:///linear_mirror.db for development, the mirror is disabled if unset
+LINEAR_MIRROR_URL = os.getenv("LINEAR_MIRROR_URL")
+# Reads within this many seconds of the last incremental sync of a workspace are answered without asking Linear for changes
+LINEAR_MIRROR_SYNC_INTERVAL_SECONDS = float(
+    os.getenv("LINEAR_MIRROR_SYNC_INTERVAL_SECONDS", "30")
+)
+
+
+class LinearIssueMirror:
+    """Local copy of the issues of every connected Linear workspace, kept current by incremental syncs and write-through, so that issue filters are answered by the database instead of the Linear API."""
+
+    def __init__(self, url: str, sync_interval_seconds: float):
+        self.engine = create_async_engine(url=url, echo=False)
+        self.sessionmaker = sessionmaker(
+            bind=self.engine, class_=AsyncSession, expire_on_commit=False
+        )
+        self.sync_interval_seconds = sync_interval_seconds
+        self._tables_created: bool = False
+        self._tables_lock = asyncio.Lock()
+        self._synced_at: dict[str, float] = {}
+        self._sync_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._backfills: dict[str, asyncio.Task] = {}
+
+    def is_fresh(self, workspace: str) -> bool:
+        synced_at: Optional[float] = self._synced_at.get(workspace)
+        return bool(
+            synced_at and time.monotonic() - synced_at < self.sync_interval_seconds
+        )
+
+    def expire(self, workspace: str) -> None:
+        """Makes the next read of the workspace sync first, e.g. after a write could not be mirrored"""
+        self._synced_at.pop(workspace, None)
+
+    def sync_lock(self, workspace: str) -> asyncio.Lock:
+        return self._sync_locks[workspace]
+
+    def start_backfill(
+        self, workspace: str, backfill: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Runs the first full copy of a workspace in the background unless it is already running, a failed copy is resumed by the next read"""
+        task: Optional[asyncio.Task] = self._backfills.get(workspace)
+        if task and not task.done():
+            return
+        self._backfills[workspace] = asyncio.create_task(
+            self._run_backfill(workspace=workspace, backfill=backfill)
+        )
+
+    async def get_sync_state(self, workspace: str) -> Optional[LinearIssueSyncORM]:
+        await self._create_tables()
+        async with self.sessionmaker() as session:
+            return await session.get(LinearIssueSyncORM, workspace)
+
+    async def write(
+        self,
+        workspace: str,
+        issues: list[LinearIssue],
+        deleted_ids: list[str] = [],
+        sync_state: Optional[LinearIssueSyncORM] = None,
+    ) -> None:
+        """Upserts the issues and removes the deleted ones in a single transaction, recording the progress of a sync if given"""
+        await self._create_tables()
+        # Replaced rows are deleted and inserted again, which behaves the same on Postgres and SQLite
+        stale_ids: list[str] = [issue.id for issue in issues] + deleted_ids
+        async with self.sessionmaker() as session:
+            if stale_ids:
+                await session.execute(
+                    delete(LinearIssueLabelORM).where(
+                        LinearIssueLabelORM.workspace == workspace,
+                        LinearIssueLabelORM.issue_id.in_(stale_ids),
+                    )
+                )
+                await session.execute(
+                    delete(LinearIssueORM).where(
+                        LinearIssueORM.workspace == workspace,
+                        LinearIssueORM.id.in_(stale_ids),
+                    )
+                )
+            session.add_all(
+                _to_orm(workspace=workspace, issue=issue) for issue in issues
+            )
+            # Flush the issues before their labels, which reference them
+            await session.flush()
+            session.add_all(
+                LinearIssueLabelORM(workspace=workspace, issue_id=issue.id, name=label)
+                for issue in issues
+                for label in set(issue.labels or [])
+            )
+            if sync_state is not None:
+                await session.merge(sync_state)
+            await session.commit()
+        if sync_state is not None and sync_state.cursor is None:
+            self._synced_at[workspace] = time.monotonic()
+        log.info(
+            f"Mirrored {len(issues)} updated and {len(deleted_ids)} deleted Linear issues"
+        )
+
+    async def query(
+        self, workspace: str, request: LinearFilterIssuesRequest, max_results: int
+    ) -> list[LinearIssue]:
+        await self._create_tables()
+        async with self.sessionmaker() as session:
+            result = await session.execute(
+                select(LinearIssueORM.issue)
+                .where(
+                    LinearIssueORM.workspace == workspace,
+                    _build_issue_filter(workspace=workspace, request=request),
+                )
+                .order_by(LinearIssueORM.created_at.desc())
+                .limit(max_results)
+            )
+            return [LinearIssue.model_validate(issue) for issue in result.scalars()]
+
+    async def _run_backfill(
+        self, workspace: str, backfill: Callable[[], Awaitable[None]]
+    ) -> None:
+        try:
+            await backfill()
+            log.info("Finished the first full copy of a Linear workspace")
+        except Exception as e:
+            log.warning(
+                f"Linear issue mirror backfill stopped, resuming on the next read: {e}"
+            )
+
+    async def _create_tables(self) -> None:
+        # The mirror can live in its own (e.g. SQLite) database, so it creates its tables instead of relying on the Supabase schema
+        if not self._tables_created:
+            async with self._tables_lock:
+                if not self._tables_created:
+                    async with self.engine.begin() as connection:
+                        await connection.run_sync(Base.metadata.create_all)
+                    self._tables_created = True
+
+
+def _to_orm(workspace: str, issue: LinearIssue) -> LinearIssueORM:
+    return LinearIssueORM(
+        workspace=workspace,
+        id=issue.id,
+        number=issue.number,
+        title=issue.title,
+        state=issue.state,
+        assignee=issue.assignee,
+        creator=issue.creator,
+        project=issue.project,
+        cycle=issue.cycle,
+        estimate=issue.estimate,
+        created_at=issue.createdAt,
+        updated_at=issue.updatedAt,
+        issue=issue.model_dump(mode="json"),
+    )
+
+
+def _build_issue_filter(
+    workspace: str, request: LinearFilterIssuesRequest
+) -> ColumnElement[bool]:
+    """Same semantics as the IssueFilter LinearClient sends to the API, the AND clause only allows one value per field except labels"""
+    conditions: list[ColumnElement[bool]] = []
+    if request.id:
+        conditions.append(LinearIssueORM.id.in_(request.id))
+    if request.state:
+        conditions.append(LinearIssueORM.state.in_(request.state))
+    if request.number:
+        conditions.append(LinearIssueORM.number.in_(request.number))
+    if request.title:
+        conditions.append(
+            or_(
+                *[
+                    LinearIssueORM.title.contains(title, autoescape=True)
+                    for title in request.title
+                ]
+            )
+        )
+    if request.assignee:
+        conditions.append(LinearIssueORM.assignee.in_(request.assignee))
+    if request.creator:
+        conditions.append(LinearIssueORM.creator.in_(request.creator))
+    if request.project:
+        conditions.append(LinearIssueORM.project.in_(request.project))
+    if request.cycle:
+        conditions.append(LinearIssueORM.cycle.in_(request.cycle))
+    if request.labels:
+        conditions.append(
+            exists().where(
+                LinearIssueLabelORM.workspace == workspace,
+                LinearIssueLabelORM.issue_id == LinearIssueORM.id,
+                LinearIssueLabelORM.name.in_(request.labels),
+            )
+        )
+    if request.estimate:
+        conditions.append(LinearIssueORM.estimate.in_(request.estimate))
+
+    if not conditions:
+        return true()
+    return and_(*conditions) if request.use_and_clause else or_(*conditions)
+
+
+LINEAR_ISSUE_MIRROR: Optional[LinearIssueMirror] = (
+    LinearIssueMirror(
+        url=LINEAR_MIRROR_URL,
+        sync_interval_seconds=LINEAR_MIRROR_SYNC_INTERVAL_SECONDS,
+    )
+    if LINEAR_MIRROR_URL
+    else None
+)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Mapping, Optional, TypeVar
+
+from dotenv import load_dotenv
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Calls of one access token that may be in flight at the same time
+LINEAR_MAX_CONCURRENT_REQUESTS = int(os.getenv("LINEAR_MAX_CONCURRENT_REQUESTS", "10"))
+LINEAR_RATE_LIMIT_MAX_RETRIES = int(os.getenv("LINEAR_RATE_LIMIT_MAX_RETRIES", "5"))
+# Base of the exponential backoff when Linear throttles a call without saying when its budget resets
+LINEAR_RATE_LIMIT_BACKOFF_SECONDS = float(
+    os.getenv("LINEAR_RATE_LIMIT_BACKOFF_SECONDS", "1")
+)
+# Longest a call waits, whether backing off or paced, so a wrong reset header cannot hold every call back until it resets
+LINEAR_RATE_LIMIT_MAX_BACKOFF_SECONDS = float(
+    os.getenv("LINEAR_RATE_LIMIT_MAX_BACKOFF_SECONDS", "60")
+)
+# Once less than this share of a budget is left, calls are spread evenly over the time until it resets
+LINEAR_RATE_LIMIT_PACING_THRESHOLD = float(
+    os.getenv("LINEAR_RATE_LIMIT_PACING_THRESHOLD", "0.1")
+)
+
+T = TypeVar("T")
+
+
+class _Budget:
+    """One of the two budgets Linear enforces per token, as last reported by its response headers"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None  # Epoch seconds
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        limit = headers.get(f"x-ratelimit-{self.name}-limit")
+        remaining = headers.get(f"x-ratelimit-{self.name}-remaining")
+        reset = headers.get(f"x-ratelimit-{self.name}-reset")
+        if limit is not None:
+            self.limit = int(limit)
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset is not None:
+            # Linear sends the reset as epoch milliseconds
+            self.reset_at = int(reset) / 1000
+
+    def ready_at(self, cost: float, start: float) -> float:
+        """Earliest time from start on when cost can be spent from this budget, start itself while it is comfortably above the pacing threshold"""
+        if self.remaining is None or not self.reset_at or self.reset_at <= start:
+            return start
+        if self.remaining < cost:
+            return self.reset_at
+        if (
+            self.limit
+            and self.remaining < self.limit * LINEAR_RATE_LIMIT_PACING_THRESHOLD
+        ):
+            return start + (self.reset_at - start) * cost / self.remaining
+        return start
+
+    def spend(self, cost: float) -> None:
+        # Counted down locally so that concurrent calls do not all see the same remaining budget
+        if self.remaining is not None:
+            self.remaining = max(0, int(self.remaining - cost))
+
+
+class LinearRateLimitScheduler:
+    """Queues the calls of one access token, paces them to the request and complexity budgets Linear reports, and retries throttled calls with backoff."""
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(LINEAR_MAX_CONCURRENT_REQUESTS)
+        # Dispatch times are reserved one at a time so that pacing delays add up instead of overlapping, the waiting itself happens outside of it
+        self._dispatch_lock = asyncio.Lock()
+        self._next_dispatch_at: float = 0.0
+        self._requests = _Budget("requests")
+        self._complexity = _Budget("complexity")
+        # Complexity of the last call of each operation, used as the expected cost of its next call
+        self._expected_complexity: dict[str, float] = {}
+        # Complexity of the last call of any operation, used for operations that were not called yet
+        self._last_complexity: float = 0.0
+        self._paused_until: float = 0.0
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        get_headers: Callable[[], Optional[Mapping[str, str]]],
+        cost_key: Optional[str] = None,
+    ) -> T:
+        """Runs call once the budgets allow it, cost_key identifies the operation whose complexity the call is expected to cost"""
+        attempt: int = 0
+        while True:
+            async with self._semaphore:
+                await self._wait_for_budget(cost_key=cost_key)
+                try:
+                    result: T = await call()
+                except Exception as e:
+                    self._observe(get_headers(), cost_key=cost_key)
+                    if (
+                        not _is_rate_limited(e)
+                        or attempt >= LINEAR_RATE_LIMIT_MAX_RETRIES
+                    ):
+                        raise
+                    attempt += 1
+                    delay: float = self._backoff(attempt=attempt)
+                    self._paused_until = max(self._paused_until, time.time() + delay)
+                    log.warning(
+                        f"Linear rate limit hit, retrying in {delay:.1f}s (attempt {attempt}/{LINEAR_RATE_LIMIT_MAX_RETRIES})"
+                    )
+                    continue
+            self._observe(get_headers(), cost_key=cost_key)
+            return result
+
+    async def _wait_for_budget(self, cost_key: Optional[str]) -> None:
+        async with self._dispatch_lock:
+            now: float = time.time()
+            cost: float = self._expected_complexity.get(cost_key, self._last_complexity)
+            start: float = max(now, self._paused_until, self._next_dispatch_at)
+            dispatch_at: float = min(
+                max(
+                    self._requests.ready_at(cost=1, start=start),
+                    self._complexity.ready_at(cost=cost, start=start),
+                ),
+                now + LINEAR_RATE_LIMIT_MAX_BACKOFF_SECONDS,
+            )
+            self._next_dispatch_at = dispatch_at
+            self._requests.spend(cost=1)
+            self._complexity.spend(cost=cost)
+        delay: float = dispatch_at - now
+        if delay > 0:
+            log.info(
+                f"Pacing Linear call by {delay:.2f}s to stay within its rate limits"
+            )
+            await asyncio.sleep(delay)
+
+    def _observe(
+        self, headers: Optional[Mapping[str, str]], cost_key: Optional[str]
+    ) -> None:
+        if not headers:
+            return
+        self._requests.update(headers)
+        self._complexity.update(headers)
+        complexity = headers.get("x-complexity")
+        if complexity is not None:
+            self._last_complexity = float(complexity)
+            if cost_key is not None:
+                self._expected_complexity[cost_key] = self._last_complexity
+
+    def _backoff(self, attempt: int) -> float:
+        # Wait for the exhausted budget to reset if Linear said when, otherwise back off exponentially with jitter
+        now: float = time.time()
+        resets: list[float] = [
+            budget.reset_at - now
+            for budget in (self._requests, self._complexity)
+            if budget.remaining == 0 and budget.reset_at and budget.reset_at > now
+        ]
+        delay: float = (
+            max(resets)
+            if resets
+            else LINEAR_RATE_LIMIT_BACKOFF_SECONDS
+            * 2 ** (attempt - 1)
+            * random.uniform(1, 1.5)
+        )
+        return min(delay, LINEAR_RATE_LIMIT_MAX_BACKOFF_SECONDS)
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    if isinstance(e, TransportServerError):
+        return e.code == 429
+    if isinstance(e, TransportQueryError):
+        # Linear answers throttled GraphQL requests with a RATELIMITED error code
+        return any(
+            isinstance(error, dict)
+            and error.get("extensions", {}).get("code") == "RATELIMITED"
+            for error in e.errors or []
+        )
+    return False
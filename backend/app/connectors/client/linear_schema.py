@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from gql.client import AsyncClientSession
+from graphql import GraphQLSchema, build_schema, print_schema
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Point this at a committed file to vendor the schema, otherwise it is written to the user's cache directory after the first introspection
+LINEAR_SCHEMA_PATH = Path(
+    os.getenv("LINEAR_SCHEMA_PATH")
+    or Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "controller"
+    / "linear.graphql"
+)
+# Re-fetch the schema in the background once it is older than this, 0 disables the refresh
+LINEAR_SCHEMA_REFRESH_SECONDS = float(os.getenv("LINEAR_SCHEMA_REFRESH_SECONDS", "0"))
+
+
+class LinearSchemaCache:
+    """Keeps the Linear GraphQL schema for the whole process, so that gql can validate documents locally without sending an introspection query for every new client."""
+
+    def __init__(self, path: Path, refresh_seconds: float):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._schema: Optional[GraphQLSchema] = None
+        self._fetched_at: Optional[float] = None
+        self._loaded: bool = False
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def get(self) -> Optional[GraphQLSchema]:
+        """Returns the cached schema, reading the persisted SDL on first use, or None if the schema was never fetched"""
+        if not self._loaded:
+            self._loaded = True
+            if self.path.exists():
+                self._schema = build_schema(self.path.read_text())
+                self._fetched_at = self.path.stat().st_mtime
+                log.info(f"Loaded Linear schema from {self.path}")
+        return self._schema
+
+    def save(self, schema: GraphQLSchema) -> None:
+        self._schema = schema
+        self._fetched_at = time.time()
+        self._loaded = True
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(print_schema(schema))
+        except OSError as e:
+            # The schema stays cached in memory for this process either way
+            log.warning(f"Could not persist the Linear schema to {self.path}: {e}")
+
+    def schedule_refresh(self, session: AsyncClientSession) -> None:
+        if not self.refresh_seconds or not self._fetched_at:
+            return
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        if time.time() - self._fetched_at < self.refresh_seconds:
+            return
+        self._refresh_task = asyncio.create_task(self._refresh(session=session))
+
+    async def _refresh(self, session: AsyncClientSession) -> None:
+        try:
+            await session.fetch_schema()
+        except Exception as e:
+            log.warning(f"Failed to refresh the Linear schema: {e}")
+            # Wait for another refresh interval instead of retrying on every request
+            self._fetched_at = time.time()
+            return
+        self.save(schema=session.client.schema)
+        log.info("Refreshed Linear schema")
+
+
+LINEAR_SCHEMA_CACHE = LinearSchemaCache(
+    path=LINEAR_SCHEMA_PATH, refresh_seconds=LINEAR_SCHEMA_REFRESH_SECONDS
+)
@@ -0,0 +1,91 @@
+import logging
+import os
+from functools import lru_cache
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# HTTP/2 requires the optional h2 package (pip install "httpx[http2]")
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that keeps count of the requests it has sent so that pool utilisation can be reported."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        super().__init__(limits=limits, http2=http2)
+        self.limits = limits
+        self.http2 = http2
+        self.requests_sent = 0
+        self.requests_in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests_sent += 1
+        self.requests_in_flight += 1
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.requests_in_flight -= 1
+
+    def pool_stats(self) -> dict[str, int]:
+        connections = self._pool.connections
+        idle_connections = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "open_connections": len(connections),
+            "active_connections": len(connections) - idle_connections,
+            "idle_connections": idle_connections,
+            "requests_in_flight": self.requests_in_flight,
+            "requests_sent": self.requests_sent,
+        }
+
+
+@lru_cache(maxsize=1)
+def _get_transport() -> PooledTransport:
+    return PooledTransport(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=LLM_HTTP2,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> AsyncOpenAI:
+    """Returns the process-wide LLM client shared by every agent, so consecutive agent hops reuse warm connections."""
+    log.info(
+        "Creating shared LLM client (max_connections=%s, max_keepalive_connections=%s, http2=%s)",
+        LLM_MAX_CONNECTIONS,
+        LLM_MAX_KEEPALIVE_CONNECTIONS,
+        LLM_HTTP2,
+    )
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(
+            transport=_get_transport(),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        ),
+    )
+
+
+def get_llm_pool_stats() -> dict[str, int]:
+    return _get_transport().pool_stats()
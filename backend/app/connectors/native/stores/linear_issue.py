@@ -0,0 +1,59 @@
+from sqlalchemy import JSON, Column, ForeignKeyConstraint, Index, Integer, String
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+# Issues are keyed by workspace as well, since one mirror database serves every connected Linear workspace
+class LinearIssueORM(Base):
+    __tablename__ = "linear_issue"
+
+    workspace = Column(String, primary_key=True)
+    id = Column(String, primary_key=True)
+    number = Column(Integer, nullable=True)
+    title = Column(String, nullable=True)
+    state = Column(String, nullable=True)
+    assignee = Column(String, nullable=True)
+    creator = Column(String, nullable=True)
+    project = Column(String, nullable=True)
+    cycle = Column(Integer, nullable=True)
+    estimate = Column(Integer, nullable=True)
+    created_at = Column(String, nullable=True)  # ISO 8601 as returned by Linear
+    updated_at = Column(String, nullable=True)  # ISO 8601 as returned by Linear
+    issue = Column(JSON, nullable=False)  # The full LinearIssue
+
+    __table_args__ = (
+        Index("ix_linear_issue_workspace_state", "workspace", "state"),
+        Index("ix_linear_issue_workspace_assignee", "workspace", "assignee"),
+        Index("ix_linear_issue_workspace_cycle", "workspace", "cycle"),
+    )
+
+
+# Labels get their own rows so that "has any of these labels" is an indexed lookup on every database
+class LinearIssueLabelORM(Base):
+    __tablename__ = "linear_issue_label"
+
+    workspace = Column(String, primary_key=True)
+    issue_id = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["workspace", "issue_id"],
+            ["linear_issue.workspace", "linear_issue.id"],
+            ondelete="CASCADE",
+        ),
+        Index("ix_linear_issue_label_workspace_name", "workspace", "name"),
+    )
+
+
+class LinearIssueSyncORM(Base):
+    __tablename__ = "linear_issue_sync"
+
+    workspace = Column(String, primary_key=True)
+    # Largest updatedAt of the last finished sync, the next sync only asks for issues updated after it. None until the first full copy finishes.
+    updated_at = Column(String, nullable=True)
+    # Progress of an unfinished sync, which resumes after this cursor instead of starting over
+    cursor = Column(String, nullable=True)
+    # Largest updatedAt seen by the unfinished sync so far, which becomes updated_at once it finishes
+    pending_updated_at = Column(String, nullable=True)
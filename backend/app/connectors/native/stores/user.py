@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import UUID, Column, DateTime, Integer, String
+from sqlalchemy import UUID, Column, DateTime, Float, Integer, String
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -25,6 +25,9 @@ class UserORM(Base):
     updated_at = Column(
         DateTime, nullable=False, default=func.now(), onupdate=func.now()
     )  # Automatically use the current timestamp of the database server upon creation and update
+    # Per API key overrides of the agent loop limits, the defaults in app/config.py apply when unset
+    max_agent_hops = Column(Integer, nullable=True)
+    query_deadline_seconds = Column(Float, nullable=True)
 
 
 class User(BaseObject):
@@ -35,6 +38,8 @@ class User(BaseObject):
     api_key: str
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    max_agent_hops: Optional[int] = None
+    query_deadline_seconds: Optional[float] = None
 
     @classmethod
     def local(
@@ -69,4 +74,10 @@ class User(BaseObject):
             updated_at=sql_value_to_typed_value(
                 dict=kwargs, key="updated_at", type=datetime
             ),
+            max_agent_hops=sql_value_to_typed_value(
+                dict=kwargs, key="max_agent_hops", type=int
+            ),
+            query_deadline_seconds=sql_value_to_typed_value(
+                dict=kwargs, key="query_deadline_seconds", type=float
+            ),
         )
@@ -1,10 +1,18 @@
 import logging
+from typing import AsyncIterator
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ValidationError
 
-from app.models.query import QueryRequest, QueryResponse
+from app.models.query import (
+    Message,
+    QueryRequest,
+    QueryResponse,
+    QueryStreamEvent,
+    QueryStreamEventType,
+    Role,
+)
 from app.services.query import QueryService
 
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +41,7 @@ class QueryController:
                     api_key=input.api_key,
                     integrations=input.integrations,
                     instance=input.instance,
+                    routing_mode=input.routing_mode,
                 )
                 return JSONResponse(
                     status_code=200,
@@ -54,6 +63,40 @@ class QueryController:
                     detail="An unexpected error occurred in query controller for general query endpoint",
                 ) from e
 
+        @router.post("/stream")
+        async def query_stream(input: QueryRequest) -> StreamingResponse:
+            events: AsyncIterator[QueryStreamEvent] = self.service.stream_query(
+                message=input.message,
+                chat_history=input.chat_history,
+                api_key=input.api_key,
+                integrations=input.integrations,
+                instance=input.instance,
+                routing_mode=input.routing_mode,
+            )
+            try:
+                # Wait for the first step so that setup errors (e.g. missing tokens) still surface as a proper HTTP error
+                first_event: QueryStreamEvent = await anext(events)
+            except ValidationError as e:
+                log.error(
+                    "Validation error in query controller for stream endpoint: %s",
+                    str(e),
+                )
+                raise HTTPException(status_code=422, detail="Validation error") from e
+            except Exception as e:
+                log.error(
+                    "Unexpected error in query controller for stream endpoint: %s",
+                    str(e),
+                )
+                raise HTTPException(
+                    status_code=500,
+                    detail="An unexpected error occurred in query controller for stream endpoint",
+                ) from e
+            return StreamingResponse(
+                _to_server_sent_events(first_event=first_event, events=events),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
         @router.post("/linear")
         async def query_linear(input: QueryRequest) -> JSONResponse:
             try:
@@ -106,3 +149,31 @@ class QueryController:
                     status_code=500,
                     detail="An unexpected error occurred in query controller for gmail endpoint",
                 ) from e
+
+
+async def _to_server_sent_events(
+    first_event: QueryStreamEvent, events: AsyncIterator[QueryStreamEvent]
+) -> AsyncIterator[str]:
+    yield _format_server_sent_event(first_event)
+    try:
+        async for event in events:
+            yield _format_server_sent_event(event)
+    except Exception as e:
+        # Headers are already sent at this point, so the error has to be reported in-band
+        log.error(
+            "Unexpected error in query controller for stream endpoint: %s", str(e)
+        )
+        yield _format_server_sent_event(
+            QueryStreamEvent(
+                event=QueryStreamEventType.ERROR,
+                message=Message(
+                    role=Role.ASSISTANT,
+                    content="An unexpected error occurred in query controller for stream endpoint",
+                    error=True,
+                ),
+            )
+        )
+
+
+def _format_server_sent_event(event: QueryStreamEvent) -> str:
+    return f"event: {event.event}\ndata: {event.model_dump_json(exclude_none=True)}\n\n"
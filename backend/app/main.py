@@ -1,8 +1,10 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.connectors.client.linear import close_linear_clients
 from app.controllers.feedback import FeedbackController
 from app.controllers.query import QueryController
 from app.controllers.token import TokenController
@@ -16,7 +18,15 @@ from app.services.user import UserService
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Cached clients keep their connection pools open until they are closed
+    await close_linear_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from abc import abstractmethod
+from typing import Any, Awaitable, Optional
+
+from app.models.agents.base.summary import SUMMARY_AGENT
+from app.models.agents.base.template import Agent, AgentResponse
+from app.models.query import Message, Role
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class RequestAgent(Agent):
+    """Agent whose tools are API requests. The LLM call that picks and fills in the request is kept apart from the connector call that runs it, so a request chosen elsewhere (e.g. by the router agent) can be executed directly."""
+
+    async def query(
+        self,
+        chat_history: list[dict],
+        access_token: str,
+        refresh_token: Optional[str],
+        client_id: Optional[str],
+        client_secret: Optional[str],
+    ) -> AgentResponse:
+        response, tool_calls = await self.get_response(chat_history=chat_history)
+        if not tool_calls:
+            log.info(f"{self.name} no tools call error response: %s", response)
+            return AgentResponse(
+                agent=SUMMARY_AGENT,
+                message=Message(role=Role.ASSISTANT, content=response, error=True),
+            )
+
+        # The model can return several requests at once (e.g. one per email), which are independent of each other
+        responses: list[AgentResponse] = await gather_agent_responses(
+            [
+                self.execute(
+                    function_name=tool_call.function.name,
+                    request=tool_call.function.parsed_arguments,
+                    access_token=access_token,
+                    refresh_token=refresh_token,
+                    client_id=client_id,
+                    client_secret=client_secret,
+                )
+                for tool_call in tool_calls
+            ]
+        )
+        return merge_agent_responses(responses)
+
+    @abstractmethod
+    async def execute(
+        self,
+        function_name: str,
+        request: Any,
+        access_token: str,
+        refresh_token: Optional[str],
+        client_id: Optional[str],
+        client_secret: Optional[str],
+    ) -> AgentResponse:
+        pass
+
+
+async def gather_agent_responses(
+    calls: list[Awaitable[AgentResponse]],
+) -> list[AgentResponse]:
+    """Runs the calls concurrently, turning each failed call into an error response so that the results of the others are kept"""
+    results: list[AgentResponse | BaseException] = await asyncio.gather(
+        *calls, return_exceptions=True
+    )
+    responses: list[AgentResponse] = []
+    for result in results:
+        if not isinstance(result, BaseException):
+            responses.append(result)
+            continue
+        if not isinstance(result, Exception):
+            # e.g. CancelledError, which has to reach the caller
+            raise result
+        log.error(f"Request failed while running alongside others: {result}")
+        responses.append(
+            AgentResponse(
+                agent=SUMMARY_AGENT,
+                message=Message(
+                    role=Role.ASSISTANT,
+                    content=f"This request failed. Please check the message history and advise the user on what might be the cause of the problem.\nError: {result}",
+                    error=True,
+                ),
+            )
+        )
+    return responses
+
+
+def merge_agent_responses(responses: list[AgentResponse]) -> AgentResponse:
+    """Merges the responses of requests that were executed together into one, in the order the requests were made"""
+    if len(responses) == 1:
+        return responses[0]
+    data: list[dict] = [
+        item for response in responses for item in response.message.data or []
+    ]
+    return AgentResponse(
+        # Carry on as long as one request succeeded, the next agent still sees the failed ones in the chat history
+        agent=next(
+            (
+                response.agent
+                for response in responses
+                if response.agent is not SUMMARY_AGENT
+            ),
+            SUMMARY_AGENT,
+        ),
+        message=Message(
+            role=Role.ASSISTANT,
+            content="\n".join(response.message.content for response in responses),
+            data=data or None,
+            error=all(response.message.error for response in responses),
+        ),
+    )
@@ -1,29 +1,21 @@
 import logging
-import os
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 import openai
-from dotenv import load_dotenv
-from openai import OpenAI
 
-from app.config import OPENAI_GPT4O_MINI
+from app.config import OPENAI_GPT4O_MINI, SUMMARY_HISTORY_TOKEN_BUDGET
 from app.models.agents.base.template import Agent, AgentResponse
 from app.models.integrations.base import Integration, SummaryResponse
 from app.models.query import Message, Role
+from app.utils.usage import record_prompt_usage
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
 
 class SummaryAgent(Agent):
 
-    def query(
+    async def query(
         self,
         chat_history: list[dict],
         access_token: str,
@@ -32,11 +24,10 @@ class SummaryAgent(Agent):
         client_secret: Optional[str] = None,
     ) -> AgentResponse:
         # No need for tools in this agent (for now)
-        message_lst: list = [{"role": "system", "content": self.system_prompt}]
-        message_lst.extend(chat_history)
-        response = openai_client.chat.completions.create(
-            model=self.model, messages=message_lst
+        response = await self.llm_client.chat.completions.create(
+            model=self.model, messages=self.build_messages(chat_history)
         )
+        record_prompt_usage(self.usage_key, response.usage)
         return AgentResponse(
             agent=None,
             message=Message(
@@ -44,11 +35,27 @@ class SummaryAgent(Agent):
             ),
         )
 
+    async def stream(self, chat_history: list[dict]) -> AsyncIterator[str]:
+        """Same as query, but yields the summary token by token as it is generated"""
+        response = await self.llm_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(chat_history),
+            stream=True,
+            # Usage, including cached prompt tokens, only comes with an extra final chunk that has no choices
+            stream_options={"include_usage": True},
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_prompt_usage(self.usage_key, chunk.usage)
+
 
 SUMMARY_AGENT = SummaryAgent(
     name="Summary Agent",
     integration_group=Integration.NONE,
     model=OPENAI_GPT4O_MINI,
+    history_token_budget=SUMMARY_HISTORY_TOKEN_BUDGET,
     system_prompt="""You are an expert at summarizing conversations between a human user and an AI agent called Expand. Create a clear, concise summary of actions taken and results achieved in no more than a few lines. Include:
 - Brief overview of accomplishments or attempts
 - Main tasks executed by Expand
@@ -1,21 +1,22 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from types import MappingProxyType
+from typing import Any, Callable, Optional
 
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel
+from openai import AsyncOpenAI
+from pydantic import BaseModel, PrivateAttr
 
+from app.config import DEFAULT_HISTORY_TOKEN_BUDGET, HISTORY_KEEP_RECENT_MESSAGES
+from app.connectors.client.llm import get_llm_client
 from app.models.integrations.base import Integration
 from app.models.query import Message
-
-load_dotenv()
+from app.utils.history import compact_chat_history
+from app.utils.tools import function_to_schema
+from app.utils.usage import record_prompt_usage
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-openai_client = OpenAI()
-
 
 class Agent(BaseModel, ABC):
     name: str
@@ -23,9 +24,52 @@ class Agent(BaseModel, ABC):
     model: str
     system_prompt: str
     tools: list
+    history_token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET
+
+    # Compiled once in model_post_init so that no hop has to rebuild them
+    _system_message: MappingProxyType = PrivateAttr()
+    _tool_schemas: tuple[dict, ...] = PrivateAttr()
+    _tool_dispatch: MappingProxyType = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._system_message = MappingProxyType(
+            {"role": "system", "content": self.system_prompt}
+        )
+        # Request agents pass ready-made schemas (openai.pydantic_function_tool), triage agents pass plain functions
+        self._tool_schemas = tuple(
+            tool if isinstance(tool, dict) else function_to_schema(tool)
+            for tool in self.tools
+        )
+        self._tool_dispatch = MappingProxyType(
+            {tool.__name__: tool for tool in self.tools if callable(tool)}
+        )
+
+    @property
+    def tool_dispatch(self) -> MappingProxyType[str, Callable]:
+        return self._tool_dispatch
+
+    def build_messages(self, chat_history: list[Message]) -> list:
+        return [
+            dict(self._system_message),
+            *compact_chat_history(
+                chat_history=chat_history,
+                token_budget=self.history_token_budget,
+                keep_recent=HISTORY_KEEP_RECENT_MESSAGES,
+                agent_name=self.name,
+            ),
+        ]
+
+    @property
+    def llm_client(self) -> AsyncOpenAI:
+        return get_llm_client()
+
+    @property
+    def usage_key(self) -> str:
+        # Agent names are only unique within an integration (e.g. every integration has a "Triage Agent")
+        return f"{self.integration_group}:{self.name}"
 
     @abstractmethod
-    def query(
+    async def query(
         self,
         chat_history: list[dict],
         access_token: str,
@@ -35,32 +79,40 @@ class Agent(BaseModel, ABC):
     ) -> "AgentResponse":
         pass
 
-    def get_response(
+    async def get_response(
         self,
         chat_history: list[dict],
-    ) -> tuple[Any, Optional[str]]:
-        message_lst: list = [{"role": "system", "content": self.system_prompt}]
-        message_lst.extend(chat_history)
-        response = openai_client.beta.chat.completions.parse(
+    ) -> tuple[Any, list]:
+        """Returns the completion together with every tool call in it, or the message content and no tool calls if the model did not call a tool"""
+        response = await self.llm_client.beta.chat.completions.parse(
             model=self.model,
-            messages=message_lst,
-            tools=self.tools,
+            messages=self.build_messages(chat_history),
+            tools=list(self._tool_schemas),
             tool_choice="required",
         )
+        record_prompt_usage(self.usage_key, response.usage)
 
-        if not response.choices[0].message.tool_calls:
+        tool_calls: list = response.choices[0].message.tool_calls or []
+        if not tool_calls:
             log.info("No tool calls")
-            return response.choices[0].message.content, None
+            return response.choices[0].message.content, []
+
+        for tool_call in tool_calls:
+            log.info(
+                f"Parsed Arguments for {tool_call.function.name}: {tool_call.function.parsed_arguments}"
+            )
+
+        return response, tool_calls
 
-        function_name: str = response.choices[0].message.tool_calls[0].function.name
-        parsed_arguments = (
-            response.choices[0].message.tool_calls[0].function.parsed_arguments
-        )
-        log.info(f"Parsed Arguments: {parsed_arguments}")
 
-        return response, function_name
+class RoutedRequest(BaseModel):
+    agent: Agent
+    function_name: str
+    request: Any
 
 
 class AgentResponse(BaseModel):
     agent: Optional[Agent]
     message: Message
+    # Set when the requests were already chosen and parsed (e.g. by the router agent), so their agents only have to execute them
+    routed_requests: list[RoutedRequest] = []
@@ -1,18 +1,22 @@
+import asyncio
 import logging
 from typing import Optional
 
 import openai
+from pydantic import BaseModel
 
 from app.config import OPENAI_GPT4O_MINI
 from app.connectors.client.gmail import GmailClient
 from app.exceptions.exception import InferenceError
+from app.models.agents.base.request import RequestAgent
 from app.models.agents.base.summary import transfer_to_summary_agent
-from app.models.agents.base.template import Agent, AgentResponse
+from app.models.agents.base.template import AgentResponse
 from app.models.agents.base.triage import TriageAgent
 from app.models.agents.main import MAIN_TRIAGE_AGENT
 from app.models.integrations.base import Integration
 from app.models.integrations.gmail import (
     Gmail,
+    GmailBulkResult,
     GmailDeleteEmailsRequest,
     GmailGetEmailsRequest,
     GmailSendEmailRequest,
@@ -25,20 +29,31 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 log = logging.getLogger(__name__)
 
+
+def _bulk_result_content(result: GmailBulkResult, action: str) -> str:
+    content: str = f"{result.count} emails were {action}"
+    if len(result.emails) < result.count:
+        content += f", here are the newest {len(result.emails)} of them"
+    if result.truncated:
+        # Otherwise the user would assume every matching email was handled
+        content += f"\nThe query matched more than {result.count} emails, only the newest {result.count} were {action}. Tell the user that the rest were left as they are."
+    return content
+
+
 ##############################################
 
 
-class GmailGetRequestAgent(Agent):
+class GmailGetRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
         client = GmailClient(
             access_token=access_token,
             refresh_token=refresh_token,
@@ -47,11 +62,9 @@ class GmailGetRequestAgent(Agent):
         )
         match function_name:
             case GmailGetEmailsRequest.__name__:
-                email_lst: list[Gmail] = client.get_emails(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
-                )
+                email_lst: list[Gmail] = [
+                    email async for email in client.iter_emails(request=request)
+                ]
                 if not email_lst:
                     return AgentResponse(
                         agent=MAIN_TRIAGE_AGENT,
@@ -86,17 +99,17 @@ GMAIL_GET_REQUEST_AGENT = GmailGetRequestAgent(
 ##############################################
 
 
-class GmailUpdateRequestAgent(Agent):
+class GmailUpdateRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
         client = GmailClient(
             access_token=access_token,
             refresh_token=refresh_token,
@@ -106,12 +119,10 @@ class GmailUpdateRequestAgent(Agent):
 
         match function_name:
             case MarkAsReadRequest.__name__:
-                updated_emails: list[Gmail] = client.mark_as_read(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
+                result: GmailBulkResult = await asyncio.to_thread(
+                    client.mark_as_read, request=request
                 )
-                if not updated_emails:
+                if not result.count:
                     return AgentResponse(
                         agent=MAIN_TRIAGE_AGENT,
                         message=Message(
@@ -124,8 +135,10 @@ class GmailUpdateRequestAgent(Agent):
                     agent=MAIN_TRIAGE_AGENT,
                     message=Message(
                         role=Role.ASSISTANT,
-                        content=f"Here are the emails marked as read",
-                        data=[email.model_dump() for email in updated_emails],
+                        content=_bulk_result_content(
+                            result=result, action="marked as read"
+                        ),
+                        data=[email.model_dump() for email in result.emails],
                     ),
                 )
             case _:
@@ -145,17 +158,17 @@ GMAIL_UPDATE_REQUEST_AGENT = GmailUpdateRequestAgent(
 ##############################################
 
 
-class GmailPostRequestAgent(Agent):
+class GmailPostRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
         client = GmailClient(
             access_token=access_token,
             refresh_token=refresh_token,
@@ -164,10 +177,8 @@ class GmailPostRequestAgent(Agent):
         )
         match function_name:
             case GmailSendEmailRequest.__name__:
-                sent_email: Gmail = client.send_email(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
+                sent_email: Gmail = await asyncio.to_thread(
+                    client.send_email, request=request
                 )
                 return AgentResponse(
                     agent=MAIN_TRIAGE_AGENT,
@@ -192,18 +203,17 @@ GMAIL_POST_REQUEST_AGENT = GmailPostRequestAgent(
 ##############################################
 
 
-class GmailDeleteRequestAgent(Agent):
+class GmailDeleteRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-
         client = GmailClient(
             access_token=access_token,
             refresh_token=refresh_token,
@@ -212,12 +222,10 @@ class GmailDeleteRequestAgent(Agent):
         )
         match function_name:
             case GmailDeleteEmailsRequest.__name__:
-                deleted_emails: list[Gmail] = client.delete_emails(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
+                result: GmailBulkResult = await asyncio.to_thread(
+                    client.delete_emails, request=request
                 )
-                if not deleted_emails:
+                if not result.count:
                     return AgentResponse(
                         agent=MAIN_TRIAGE_AGENT,
                         message=Message(
@@ -230,8 +238,8 @@ class GmailDeleteRequestAgent(Agent):
                     agent=MAIN_TRIAGE_AGENT,
                     message=Message(
                         role=Role.ASSISTANT,
-                        content=f"The following emails have been successfully deleted",
-                        data=[email.model_dump() for email in deleted_emails],
+                        content=_bulk_result_content(result=result, action="deleted"),
+                        data=[email.model_dump() for email in result.emails],
                     ),
                 )
             case _:
@@ -280,3 +288,10 @@ GMAIL_TRIAGE_AGENT = TriageAgent(
         transfer_to_summary_agent,
     ],
 )
+
+GMAIL_REQUEST_AGENTS: list[RequestAgent] = [
+    GMAIL_POST_REQUEST_AGENT,
+    GMAIL_GET_REQUEST_AGENT,
+    GMAIL_UPDATE_REQUEST_AGENT,
+    GMAIL_DELETE_REQUEST_AGENT,
+]
@@ -2,17 +2,19 @@ import logging
 from typing import Optional
 
 import openai
-from openai import OpenAI
+from pydantic import BaseModel
 
 from app.config import OPENAI_GPT4O_MINI
-from app.connectors.client.linear import LinearClient
+from app.connectors.client.linear import get_linear_client
 from app.exceptions.exception import InferenceError
+from app.models.agents.base.request import RequestAgent
 from app.models.agents.base.summary import SUMMARY_AGENT, transfer_to_summary_agent
-from app.models.agents.base.template import Agent, AgentResponse
+from app.models.agents.base.template import AgentResponse
 from app.models.agents.base.triage import TriageAgent
 from app.models.agents.main import MAIN_TRIAGE_AGENT
 from app.models.integrations.base import Integration
 from app.models.integrations.linear import (
+    LinearBulkResult,
     LinearCreateIssueRequest,
     LinearDeleteIssuesRequest,
     LinearGetIssuesRequest,
@@ -20,73 +22,83 @@ from app.models.integrations.linear import (
     LinearUpdateIssuesRequest,
 )
 from app.models.query import Message, Role
+from app.utils.fuzzy import AmbiguousNameError, UnconfirmedNameError
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 log = logging.getLogger(__name__)
-openai_client = OpenAI()
 
 
-class LinearPostRequestAgent(Agent):
+def _name_confirmation_response(
+    e: AmbiguousNameError | UnconfirmedNameError,
+) -> AgentResponse:
+    # Names that match several entities equally well, or that only match a different name when issues are changed, need the user
+    return AgentResponse(
+        agent=SUMMARY_AGENT,
+        message=Message(role=Role.ASSISTANT, content=str(e), error=True),
+    )
 
-    def query(
+
+def _bulk_result_content(result: LinearBulkResult, action: str) -> str:
+    content: str = f"{result.count} Linear issues were {action}"
+    if len(result.issues) < result.count:
+        content += f", here are the first {len(result.issues)} of them"
+    if result.truncated:
+        # Otherwise the user would assume every matching issue was handled
+        content += f"\nThe filter matched more than {result.count} issues, only {result.count} were {action}. Tell the user that the rest were left as they are."
+    if result.failed_ids:
+        content += f"\n{len(result.failed_ids)} Linear issues could not be {action}, their ids are: {', '.join(result.failed_ids)}"
+    return content
+
+
+class LinearPostRequestAgent(RequestAgent):
+
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: Optional[str],
         client_secret: Optional[str],
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info(
-                "LinearPostRequestAgent no tools call error response: %s", response
-            )
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
-        linear_client = LinearClient(
-            access_token=access_token,
-        )
-        try:
-            match function_name:
-                case LinearCreateIssueRequest.__name__:
-                    try:
-                        created_issue: LinearIssue = linear_client.create_issue(
-                            request=response.choices[0]
-                            .message.tool_calls[0]
-                            .function.parsed_arguments
-                        )
-                    except Exception as e:
-                        log.info(
-                            "LinearPostRequestAgent create issue error message: %s", e
-                        )
+        async with get_linear_client(access_token=access_token) as linear_client:
+            try:
+                match function_name:
+                    case LinearCreateIssueRequest.__name__:
+                        try:
+                            created_issue: LinearIssue = (
+                                await linear_client.create_issue(request=request)
+                            )
+                        except Exception as e:
+                            log.info(
+                                "LinearPostRequestAgent create issue error message: %s",
+                                e,
+                            )
+                            return AgentResponse(
+                                agent=SUMMARY_AGENT,
+                                message=Message(
+                                    role=Role.ASSISTANT,
+                                    content=f"Failed to create issue. Please check the message history and error log to advise the user on what might be the cause of the problem.\nError: {e}",
+                                    error=True,
+                                ),
+                            )
                         return AgentResponse(
-                            agent=SUMMARY_AGENT,
+                            agent=MAIN_TRIAGE_AGENT,
                             message=Message(
                                 role=Role.ASSISTANT,
-                                content=f"Failed to create issue. Please check the message history and error log to advise the user on what might be the cause of the problem.\nError: {e}",
-                                error=True,
+                                content="Issue created successfully",
+                                data=[created_issue.model_dump()],
                             ),
                         )
-                    return AgentResponse(
-                        agent=MAIN_TRIAGE_AGENT,
-                        message=Message(
-                            role=Role.ASSISTANT,
-                            content="Issue created successfully",
-                            data=[created_issue.model_dump()],
-                        ),
-                    )
 
-                case _:
-                    raise InferenceError(f"Function {function_name} not supported")
+                    case _:
+                        raise InferenceError(f"Function {function_name} not supported")
 
-        except Exception as e:
-            log.error(f"Error in LinearPostRequestAgent: {e}")
-            raise e
+            except Exception as e:
+                log.error(f"Error in LinearPostRequestAgent: {e}")
+                raise e
 
 
 LINEAR_POST_REQUEST_AGENT = LinearPostRequestAgent(
@@ -100,58 +112,59 @@ LINEAR_POST_REQUEST_AGENT = LinearPostRequestAgent(
 ##############################################
 
 
-class LinearGetRequestAgent(Agent):
+class LinearGetRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: Optional[str],
         client_secret: Optional[str],
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info("LinearGetRequestAgent no tools call error response: %s", response)
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
-        linear_client = LinearClient(
-            access_token=access_token,
-        )
-
-        try:
-            match function_name:
-                case LinearGetIssuesRequest.__name__:
-                    retrieved_issues: list[LinearIssue] = linear_client.get_issues(
-                        request=response.choices[0]
-                        .message.tool_calls[0]
-                        .function.parsed_arguments
-                    )
-                    if not retrieved_issues:
+        async with get_linear_client(access_token=access_token) as linear_client:
+            try:
+                match function_name:
+                    case LinearGetIssuesRequest.__name__:
+                        try:
+                            # Reads may use the closest name, which the user is told about
+                            request, substitutions = (
+                                await linear_client.resolve_filter_names(
+                                    request=request, allow_substitutions=True
+                                )
+                            )
+                            retrieved_issues: list[LinearIssue] = (
+                                await linear_client.get_issues(request=request)
+                            )
+                        except AmbiguousNameError as e:
+                            return _name_confirmation_response(e)
+                        if not retrieved_issues:
+                            return AgentResponse(
+                                agent=SUMMARY_AGENT,
+                                message=Message(
+                                    role=Role.ASSISTANT,
+                                    content="No Linear issues were retrieved. Please check the message history to advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
+                                    error=True,
+                                ),
+                            )
                         return AgentResponse(
-                            agent=SUMMARY_AGENT,
+                            agent=MAIN_TRIAGE_AGENT,
                             message=Message(
                                 role=Role.ASSISTANT,
-                                content="No Linear issues were retrieved. Please check the message history to advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
-                                error=True,
+                                content="Here are the retrieved Linear issues"
+                                + "".join(
+                                    f"\nNo exact match was found for '{name}', so these are the results for '{resolved}'. Tell the user about this."
+                                    for name, resolved in substitutions.items()
+                                ),
+                                data=[issue.model_dump() for issue in retrieved_issues],
                             ),
                         )
-                    return AgentResponse(
-                        agent=MAIN_TRIAGE_AGENT,
-                        message=Message(
-                            role=Role.ASSISTANT,
-                            content="Here are the retrieved Linear issues",
-                            data=[issue.model_dump() for issue in retrieved_issues],
-                        ),
-                    )
-                case _:
-                    raise InferenceError(f"Function {function_name} not supported")
-        except Exception as e:
-            log.error(f"Error in LinearGetRequestAgent: {e}")
-            raise e
+                    case _:
+                        raise InferenceError(f"Function {function_name} not supported")
+            except Exception as e:
+                log.error(f"Error in LinearGetRequestAgent: {e}")
+                raise e
 
 
 # TODO: Add AND/OR logic to the input model
@@ -171,56 +184,47 @@ LINEAR_GET_REQUEST_AGENT = LinearGetRequestAgent(
 ##############################################
 
 
-class LinearUpdateRequestAgent(Agent):
-    def query(
+class LinearUpdateRequestAgent(RequestAgent):
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: Optional[str],
         client_secret: Optional[str],
     ) -> AgentResponse:
-        print("CHAT HISTORY")
-        print(chat_history)
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info(
-                "LinearUpdateRequestAgent no tools call error response: %s", response
-            )
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
-        linear_client = LinearClient(
-            access_token=access_token,
-        )
-        match function_name:
-            case LinearUpdateIssuesRequest.__name__:
-                updated_issues: list[LinearIssue] = linear_client.update_issues(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
-                )
-                if not updated_issues:
+        async with get_linear_client(access_token=access_token) as linear_client:
+            match function_name:
+                case LinearUpdateIssuesRequest.__name__:
+                    try:
+                        result: LinearBulkResult = await linear_client.update_issues(
+                            request=request
+                        )
+                    except (AmbiguousNameError, UnconfirmedNameError) as e:
+                        return _name_confirmation_response(e)
+                    if not result.count and not result.failed_ids:
+                        return AgentResponse(
+                            agent=SUMMARY_AGENT,
+                            message=Message(
+                                role=Role.ASSISTANT,
+                                content="No Linear issues were updated. Please check the message history and advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
+                                error=True,
+                            ),
+                        )
                     return AgentResponse(
-                        agent=SUMMARY_AGENT,
+                        agent=MAIN_TRIAGE_AGENT,
                         message=Message(
                             role=Role.ASSISTANT,
-                            content="No Linear issues were updated. Please check the message history and advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
-                            error=True,
+                            content=_bulk_result_content(
+                                result=result, action="updated"
+                            ),
+                            data=[issue.model_dump() for issue in result.issues],
+                            error=not result.count,
                         ),
                     )
-                return AgentResponse(
-                    agent=MAIN_TRIAGE_AGENT,
-                    message=Message(
-                        role=Role.ASSISTANT,
-                        content=f"Here are the updated Linear issues",
-                        data=[issue.model_dump() for issue in updated_issues],
-                    ),
-                )
-            case _:
-                raise InferenceError(f"Function {function_name} not supported")
+                case _:
+                    raise InferenceError(f"Function {function_name} not supported")
 
 
 # TODO: Add AND/OR logic to the input model
@@ -240,54 +244,47 @@ LINEAR_UPDATE_REQUEST_AGENT = LinearUpdateRequestAgent(
 ##############################################
 
 
-class LinearDeleteRequestAgent(Agent):
-    def query(
+class LinearDeleteRequestAgent(RequestAgent):
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: Optional[str],
         client_secret: Optional[str],
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info(
-                "LinearDeleteRequestAgent no tools call error response: %s", response
-            )
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
-        linear_client = LinearClient(
-            access_token=access_token,
-        )
-        match function_name:
-            case LinearDeleteIssuesRequest.__name__:
-                deleted_issues: list[LinearIssue] = linear_client.delete_issues(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
-                )
-                if not deleted_issues:
+        async with get_linear_client(access_token=access_token) as linear_client:
+            match function_name:
+                case LinearDeleteIssuesRequest.__name__:
+                    try:
+                        result: LinearBulkResult = await linear_client.delete_issues(
+                            request=request
+                        )
+                    except (AmbiguousNameError, UnconfirmedNameError) as e:
+                        return _name_confirmation_response(e)
+                    if not result.count and not result.failed_ids:
+                        return AgentResponse(
+                            agent=SUMMARY_AGENT,
+                            message=Message(
+                                role=Role.ASSISTANT,
+                                content="No Linear issues were deleted. Please check the message history and advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
+                                error=True,
+                            ),
+                        )
                     return AgentResponse(
-                        agent=SUMMARY_AGENT,
+                        agent=MAIN_TRIAGE_AGENT,
                         message=Message(
                             role=Role.ASSISTANT,
-                            content="No Linear issues were deleted. Please check the message history and advise the user on what might be the cause of the problem. It could be an issue with spelling or capitalization.",
-                            error=True,
+                            content=_bulk_result_content(
+                                result=result, action="deleted"
+                            ),
+                            data=[issue.model_dump() for issue in result.issues],
+                            error=not result.count,
                         ),
                     )
-                return AgentResponse(
-                    agent=MAIN_TRIAGE_AGENT,
-                    message=Message(
-                        role=Role.ASSISTANT,
-                        content="Here are the deleted Linear issues",
-                        data=[issue.model_dump() for issue in deleted_issues],
-                    ),
-                )
-            case _:
-                raise InferenceError(f"Function {function_name} not supported")
+                case _:
+                    raise InferenceError(f"Function {function_name} not supported")
 
 
 LINEAR_DELETE_REQUEST_AGENT = LinearDeleteRequestAgent(
@@ -338,3 +335,10 @@ LINEAR_TRIAGE_AGENT = TriageAgent(
         transfer_to_summary_agent,
     ],
 )
+
+LINEAR_REQUEST_AGENTS: list[RequestAgent] = [
+    LINEAR_POST_REQUEST_AGENT,
+    LINEAR_GET_REQUEST_AGENT,
+    LINEAR_UPDATE_REQUEST_AGENT,
+    LINEAR_DELETE_REQUEST_AGENT,
+]
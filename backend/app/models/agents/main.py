@@ -1,5 +1,9 @@
+from functools import lru_cache
+from typing import Optional
+
 from app.config import OPENAI_GPT4O_MINI
 from app.models.agents.base.summary import transfer_to_summary_agent
+from app.models.agents.base.template import Agent
 from app.models.agents.base.triage import TriageAgent
 from app.models.integrations.base import Integration
 
@@ -40,6 +44,13 @@ def transfer_to_x_triage_agent():
     return X_TRIAGE_AGENT
 
 
+INTEGRATION_TRANSFER_TOOLS = {
+    Integration.GMAIL: transfer_to_gmail_triage_agent,
+    Integration.LINEAR: transfer_to_linear_triage_agent,
+    Integration.SLACK: transfer_to_slack_triage_agent,
+    Integration.CALENDAR: transfer_to_calendar_triage_agent,
+}
+
 # this is a very delicate prompt carefully engineered by dear aaron. do not tamper unless strictly necessary
 MAIN_TRIAGE_AGENT = TriageAgent(
     name="Main Triage Agent",
@@ -63,3 +74,36 @@ MAIN_TRIAGE_AGENT = TriageAgent(
         transfer_to_summary_agent,
     ],
 )
+
+
+def get_main_triage_agent(integrations: Optional[list[Integration]]) -> TriageAgent:
+    """Returns MAIN_TRIAGE_AGENT with the transfers to integrations that are not enabled for this request removed"""
+    if not integrations:
+        return MAIN_TRIAGE_AGENT
+    return _build_main_triage_agent(frozenset(integrations))
+
+
+def get_entry_agent(integrations: Optional[list[Integration]]) -> Agent:
+    """Returns the first agent of the loop. With a single enabled integration there is nothing for the main triage agent to choose, so we go straight to that integration's triage agent"""
+    if integrations and len(set(integrations)) == 1:
+        integration: Integration = integrations[0]
+        if integration in INTEGRATION_TRANSFER_TOOLS:
+            return INTEGRATION_TRANSFER_TOOLS[integration]()
+    return get_main_triage_agent(integrations=integrations)
+
+
+@lru_cache(maxsize=None)
+def _build_main_triage_agent(integrations: frozenset[Integration]) -> TriageAgent:
+    return TriageAgent(
+        name=MAIN_TRIAGE_AGENT.name,
+        integration_group=MAIN_TRIAGE_AGENT.integration_group,
+        model=MAIN_TRIAGE_AGENT.model,
+        system_prompt=MAIN_TRIAGE_AGENT.system_prompt,
+        history_token_budget=MAIN_TRIAGE_AGENT.history_token_budget,
+        tools=[
+            tool
+            for integration, tool in INTEGRATION_TRANSFER_TOOLS.items()
+            if integration in integrations
+        ]
+        + [transfer_to_summary_agent],
+    )
@@ -0,0 +1,145 @@
+import logging
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Optional
+
+from pydantic import PrivateAttr
+
+from app.config import OPENAI_GPT4O_MINI
+from app.models.agents.base.request import RequestAgent
+from app.models.agents.base.summary import transfer_to_summary_agent
+from app.models.agents.base.template import Agent, AgentResponse, RoutedRequest
+from app.models.agents.base.triage import TriageAgent
+from app.models.agents.gmail import GMAIL_REQUEST_AGENTS
+from app.models.agents.linear import LINEAR_REQUEST_AGENTS
+from app.models.agents.main import MAIN_TRIAGE_AGENT, get_entry_agent
+from app.models.agents.slack import SLACK_REQUEST_AGENTS
+from app.models.integrations.base import Integration
+from app.models.query import Message, Role
+from app.utils.tools import execute_tool_call, function_to_schema
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+INTEGRATION_REQUEST_AGENTS: dict[Integration, list[RequestAgent]] = {
+    Integration.GMAIL: GMAIL_REQUEST_AGENTS,
+    Integration.LINEAR: LINEAR_REQUEST_AGENTS,
+    Integration.SLACK: SLACK_REQUEST_AGENTS,
+}
+
+ROUTER_SYSTEM_PROMPT = """You are an expert at turning the task described by the user into a single API request. Follow these guidelines:
+
+1. If the task can be completed with exactly one of the request tools, call that tool directly with the correct parameters.
+2. If the task is ambiguous, needs more than one request, or needs information that is not yet available in the chat history, call transfer_to_main_triage_agent.
+3. If the task has already been completed, call transfer_to_summary_agent.
+
+Rules for the individual request tools:"""
+
+
+def transfer_to_main_triage_agent() -> TriageAgent:
+    return MAIN_TRIAGE_AGENT
+
+
+class RouterAgent(TriageAgent):
+    """Shows the model the request tools of every enabled integration at once, so a simple task goes from the user message to the connector in a single LLM call instead of going through the main and integration triage agents first."""
+
+    request_agents: list[RequestAgent]
+
+    _request_dispatch: MappingProxyType = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        # beta.chat.completions.parse only accepts strict tools, so the transfer functions need strict schemas as well
+        self._tool_schemas = tuple(
+            tool if isinstance(tool, dict) else function_to_schema(tool, strict=True)
+            for tool in self.tools
+        )
+        self._request_dispatch = MappingProxyType(
+            {
+                schema["function"]["name"]: agent
+                for agent in self.request_agents
+                for schema in agent._tool_schemas
+            }
+        )
+
+    async def query(
+        self,
+        chat_history: list[dict],
+        access_token: str,
+        refresh_token: Optional[str] = None,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+    ) -> AgentResponse:
+        response, tool_calls = await self.get_response(chat_history=chat_history)
+        if not tool_calls:
+            log.info("RouterAgent no tools call response: %s", response)
+            return AgentResponse(
+                agent=MAIN_TRIAGE_AGENT,
+                message=Message(
+                    role=Role.ASSISTANT,
+                    content="Router Agent invokes transfer_to_main_triage_agent",
+                ),
+            )
+
+        routed_requests: list[RoutedRequest] = [
+            RoutedRequest(
+                agent=self._request_dispatch[tool_call.function.name],
+                function_name=tool_call.function.name,
+                request=tool_call.function.parsed_arguments,
+            )
+            for tool_call in tool_calls
+            if tool_call.function.name in self._request_dispatch
+        ]
+        if routed_requests:
+            # Transfer calls next to requests are dropped, the request agents decide where to go once their requests are done
+            return AgentResponse(
+                agent=routed_requests[0].agent,
+                message=Message(
+                    role=Role.ASSISTANT,
+                    content=f"Router Agent invokes {', '.join(routed.function_name for routed in routed_requests)}",
+                ),
+                routed_requests=routed_requests,
+            )
+
+        tool_call = tool_calls[0]
+        return AgentResponse(
+            agent=execute_tool_call(tool_call, self.tool_dispatch, self.name),
+            message=Message(
+                role=Role.ASSISTANT,
+                content=f"Router Agent invokes {tool_call.function.name}",
+            ),
+        )
+
+
+def get_router_agent(integrations: Optional[list[Integration]]) -> Agent:
+    """Returns the router agent for the enabled integrations, or the regular entry agent if none of them has request agents to route to"""
+    enabled: frozenset[Integration] = frozenset(
+        integrations if integrations else INTEGRATION_REQUEST_AGENTS.keys()
+    )
+    if not enabled & INTEGRATION_REQUEST_AGENTS.keys():
+        return get_entry_agent(integrations=integrations)
+    return _build_router_agent(enabled)
+
+
+@lru_cache(maxsize=None)
+def _build_router_agent(integrations: frozenset[Integration]) -> RouterAgent:
+    request_agents: list[RequestAgent] = [
+        agent
+        for integration, agents in INTEGRATION_REQUEST_AGENTS.items()
+        if integration in integrations
+        for agent in agents
+    ]
+    tool_rules: str = "\n\n".join(
+        f"{schema['function']['name']}: {agent.system_prompt}"
+        for agent in request_agents
+        for schema in agent._tool_schemas
+    )
+    return RouterAgent(
+        name="Router Agent",
+        integration_group=Integration.NONE,
+        model=OPENAI_GPT4O_MINI,
+        system_prompt=f"{ROUTER_SYSTEM_PROMPT}\n\n{tool_rules}",
+        tools=[tool for agent in request_agents for tool in agent.tools]
+        + [transfer_to_main_triage_agent, transfer_to_summary_agent],
+        request_agents=request_agents,
+    )
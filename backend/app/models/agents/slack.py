@@ -1,12 +1,15 @@
+import asyncio
 import logging
 from typing import Any, Optional
 
 import openai
+from pydantic import BaseModel
 
 from app.config import OPENAI_GPT4O_MINI
 from app.connectors.client.slack import SlackClient
+from app.models.agents.base.request import RequestAgent
 from app.models.agents.base.summary import SUMMARY_AGENT, transfer_to_summary_agent
-from app.models.agents.base.template import Agent, AgentResponse
+from app.models.agents.base.template import AgentResponse
 from app.models.agents.base.triage import TriageAgent
 from app.models.agents.main import MAIN_TRIAGE_AGENT
 from app.models.integrations.base import Integration
@@ -22,31 +25,22 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 log = logging.getLogger(__name__)
 
 
-class SlackPostRequestAgent(Agent):
+class SlackPostRequestAgent(RequestAgent):
 
-    def query(
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info("SlackPostRequestAgent no tools call error response: %s", response)
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
         client = SlackClient(access_token=access_token)
         match function_name:
             case SlackSendMessageRequest.__name__:
-                client_response = client.send_message(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
+                client_response = await asyncio.to_thread(
+                    client.send_message, request=request
                 )
                 if not client_response["ok"]:
                     return AgentResponse(
@@ -77,30 +71,21 @@ SLACK_POST_REQUEST_AGENT = SlackPostRequestAgent(
 ##############################################
 
 
-class SlackGetRequestAgent(Agent):
-    def query(
+class SlackGetRequestAgent(RequestAgent):
+    async def execute(
         self,
-        chat_history: list[dict],
+        function_name: str,
+        request: BaseModel,
         access_token: str,
         refresh_token: Optional[str],
         client_id: str,
         client_secret: str,
     ) -> AgentResponse:
-        response, function_name = self.get_response(chat_history=chat_history)
-        if not function_name:
-            log.info("SlackGetRequestAgent no tools call error response: %s", response)
-            return AgentResponse(
-                agent=SUMMARY_AGENT,
-                message=Message(role=Role.ASSISTANT, content=response, error=True),
-            )
-
         client = SlackClient(access_token=access_token)
         match function_name:
             case SlackGetChannelIdRequest.__name__:
-                client_response: list[dict[str, Any]] = client.get_all_channel_ids(
-                    request=response.choices[0]
-                    .message.tool_calls[0]
-                    .function.parsed_arguments
+                client_response: list[dict[str, Any]] = await asyncio.to_thread(
+                    client.get_all_channel_ids, request=request
                 )
                 if not client_response:
                     return AgentResponse(
@@ -156,3 +141,8 @@ SLACK_TRIAGE_AGENT = TriageAgent(
         transfer_to_summary_agent,
     ],
 )
+
+SLACK_REQUEST_AGENTS: list[RequestAgent] = [
+    SLACK_POST_REQUEST_AGENT,
+    SLACK_GET_REQUEST_AGENT,
+]
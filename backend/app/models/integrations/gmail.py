@@ -1,3 +1,4 @@
+from enum import StrEnum
 from typing import Optional
 
 from pydantic import BaseModel, Field, model_validator
@@ -11,6 +12,22 @@ class Gmail(BaseModel):
     body: str
 
 
+class GmailBulkResult(BaseModel):
+    # Only the first of the affected emails are fetched to show the user
+    emails: list[Gmail]
+    count: int
+    # Whether the query matched more emails than a bulk operation may affect, the rest were left alone
+    truncated: bool
+
+
+class GmailFetchProfile(StrEnum):
+    # Ids and labels only
+    MINIMAL = "minimal"
+    # Ids, labels, sender and subject
+    METADATA = "metadata"
+    FULL = "full"
+
+
 class GmailEditableFields(BaseModel):
     labelIds: Optional[list[str]]
 
@@ -22,6 +39,9 @@ class GmailFilterEmailsRequest(BaseModel):
     query: Optional[str] = Field(
         description="Query to filter emails with, if message ids are unavailable"
     )
+    max_results: Optional[int] = Field(
+        description="Maximum number of emails to filter, newest first, if the user asked for a specific number of emails"
+    )
 
     @model_validator(mode="after")
     def check_at_least_one(self):
@@ -43,26 +43,52 @@ class Project(BaseModel):
     name: str
 
 
+class LinearIssueFieldProfile(StrEnum):
+    # Just enough to refer to the issue, e.g. to update or delete it
+    IDS = "ids"
+    # Everything but the description, creator, timestamps and comments
+    SUMMARY = "summary"
+    FULL = "full"
+
+
+# Fields default to None since queries only select the fields of their LinearIssueFieldProfile
 class LinearIssue(BaseModel):
-    id: Optional[str]
-    number: Optional[int]
-    title: Optional[str]
-    description: Optional[str]
-    priority: Optional[int]
-    estimate: Optional[
-        int
-    ]  # Assume T-Shirt sizes for now, which is represented as an integer in the API
-    state: Optional[Status]
-    assignee: Optional[str]
-    creator: Optional[str]
-    labels: Optional[list[str]]
-    createdAt: Optional[str]  # Timezone but in string format
-    updatedAt: Optional[str]  # Timezone but in string format
-    dueDate: Optional[str]  # YYYY-MM-DD but in string format
-    cycle: Optional[int]
-    project: Optional[str]
-    comments: Optional[list[Comment]]
-    url: Optional[str]
+    id: Optional[str] = None
+    number: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[int] = None
+    # Assume T-Shirt sizes for now, which is represented as an integer in the API
+    estimate: Optional[int] = None
+    state: Optional[Status] = None
+    assignee: Optional[str] = None
+    creator: Optional[str] = None
+    labels: Optional[list[str]] = None
+    createdAt: Optional[str] = None  # Timezone but in string format
+    updatedAt: Optional[str] = None  # Timezone but in string format
+    dueDate: Optional[str] = None  # YYYY-MM-DD but in string format
+    cycle: Optional[int] = None
+    project: Optional[str] = None
+    comments: Optional[list[Comment]] = None
+    url: Optional[str] = None
+
+
+class LinearBulkResult(BaseModel):
+    # Only the first of the affected issues are returned to show the user
+    issues: list[LinearIssue]
+    count: int
+    # Whether the filter matched more issues than a bulk operation may affect, the rest were left alone
+    truncated: bool
+    # Issues Linear refused to change, while the rest of their batch was still applied
+    failed_ids: list[str] = []
+
+
+class LinearWorkspaceMetadata(BaseModel):
+    # Name to id maps keyed by the collection they were loaded from (users, projects, teams, workflowStates, issueLabels)
+    ids_by_name: dict[str, dict[str, str]]
+    # Number to id maps, only cycles are referred to by number
+    ids_by_number: dict[str, dict[int, str]]
+    loaded_at: float  # time.monotonic() of the load
 
 
 class LinearFilterIssuesRequest(BaseModel):
@@ -11,6 +11,13 @@ class Role(StrEnum):
     ASSISTANT = "assistant"
 
 
+class RoutingMode(StrEnum):
+    # Main triage agent -> integration triage agent -> request agent
+    CHAIN = "chain"
+    # Router agent picks the request directly, falling back to the chain when the task is ambiguous
+    FLAT = "flat"
+
+
 class Message(BaseModel):
     role: Role
     content: str
@@ -24,8 +31,24 @@ class QueryRequest(BaseModel):
     api_key: str
     integrations: list[Integration] = None
     instance: Optional[str] = None
+    routing_mode: RoutingMode = RoutingMode.FLAT
 
 
 class QueryResponse(BaseModel):
     chat_history: list[Message]
     instance: str
+
+
+class QueryStreamEventType(StrEnum):
+    TRIAGE = "triage"  # A triage/router agent picked the next agent
+    RESULT = "result"  # A request agent finished its connector call
+    SUMMARY = "summary"  # One streamed token of the summary
+    DONE = "done"  # Final event carrying the persisted instance
+    ERROR = "error"
+
+
+class QueryStreamEvent(BaseModel):
+    event: QueryStreamEventType
+    message: Optional[Message] = None
+    token: Optional[str] = None
+    response: Optional[QueryResponse] = None
@@ -0,0 +1,86 @@
+from app.config import DEFAULT_HISTORY_TOKEN_BUDGET, HISTORY_KEEP_RECENT_MESSAGES
+from app.models.query import Message, Role
+from app.utils.history import (
+    FOLD_BLOCK_SIZE,
+    compact_chat_history,
+    estimate_tokens,
+    render_message,
+)
+
+TURNS = 12
+RESULTS_PER_TURN = 3
+ITEMS_PER_RESULT = 10
+
+
+def common_prefix(a: list[Message], b: list[Message]) -> int:
+    length: int = 0
+    for message_a, message_b in zip(a, b):
+        if message_a.model_dump() != message_b.model_dump():
+            break
+        length += 1
+    return length
+
+
+def main():
+    # Every hop of every turn renders the history once more, the way consecutive agents do
+    chat_history: list[Message] = []
+    previous: list[Message] = []
+    for turn in range(TURNS):
+        hop_messages: list[Message] = [
+            Message(role=Role.USER, content=f"Instruction {turn}")
+        ] + [
+            Message(
+                role=Role.ASSISTANT,
+                content=f"Result {result} of instruction {turn}",
+                data=[
+                    {"id": f"{turn}-{result}-{item}", "title": "x" * 200}
+                    for item in range(ITEMS_PER_RESULT)
+                ],
+            )
+            for result in range(RESULTS_PER_TURN)
+        ]
+        for message in hop_messages:
+            was_compacted: bool = (
+                sum(
+                    estimate_tokens(render_message(msg).content) for msg in chat_history
+                )
+                > DEFAULT_HISTORY_TOKEN_BUDGET
+            )
+            chat_history.append(message)
+            rendered: list[Message] = compact_chat_history(
+                chat_history=chat_history,
+                token_budget=DEFAULT_HISTORY_TOKEN_BUDGET,
+                keep_recent=HISTORY_KEEP_RECENT_MESSAGES,
+                agent_name="History Benchmark",
+            )
+            stable: int = common_prefix(previous, rendered)
+            summaries: int = sum(
+                msg.content.startswith("Earlier in this conversation")
+                for msg in previous
+            )
+            newly_folded: bool = (
+                sum(
+                    msg.content.startswith("Earlier in this conversation")
+                    for msg in rendered
+                )
+                > summaries
+            )
+            # Only the messages that just left the recent window change, or the block that was just folded
+            expected: int = (
+                summaries
+                if newly_folded
+                else len(previous) - HISTORY_KEEP_RECENT_MESSAGES - 1
+            )
+            print(
+                f"{len(chat_history)} messages: {stable}/{len(previous)} leading messages unchanged"
+                + (f", folded a block of {FOLD_BLOCK_SIZE}" if newly_folded else "")
+            )
+            if was_compacted:
+                assert (
+                    stable >= expected
+                ), f"Rendered prefix changed at message {stable}, expected at least {expected} unchanged"
+            previous = rendered
+
+
+if __name__ == "__main__":
+    main()
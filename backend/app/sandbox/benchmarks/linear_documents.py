@@ -0,0 +1,73 @@
+import timeit
+from typing import Optional
+
+from gql import gql
+from graphql import GraphQLSchema, validate
+
+from app.connectors.client.linear_documents import (
+    LINEAR_DOCUMENT_SOURCES,
+    LinearOperation,
+    get_linear_document,
+)
+from app.connectors.client.linear_schema import LINEAR_SCHEMA_CACHE
+from app.models.integrations.linear import LinearIssueFieldProfile
+
+REQUESTS = 1_000
+
+# The operations of a typical "update these issues" request, with the same variants the client uses
+OPERATIONS: list[tuple[LinearOperation, LinearIssueFieldProfile, Optional[object]]] = [
+    (LinearOperation.GET_ISSUES, LinearIssueFieldProfile.FULL, None),
+    (LinearOperation.GET_ISSUES, LinearIssueFieldProfile.IDS, None),
+    (LinearOperation.GET_ISSUE, LinearIssueFieldProfile.FULL, None),
+    (LinearOperation.CREATE_ISSUE, LinearIssueFieldProfile.FULL, None),
+    (LinearOperation.UPDATE_ISSUES, LinearIssueFieldProfile.FULL, 25),
+    (LinearOperation.DELETE_ISSUES, LinearIssueFieldProfile.FULL, 25),
+    (LinearOperation.GET_WORKSPACE_METADATA, LinearIssueFieldProfile.FULL, None),
+    (LinearOperation.GET_ID_BY_NAME, LinearIssueFieldProfile.FULL, "users"),
+]
+
+
+def parse_per_request(
+    operation: LinearOperation,
+    profile: LinearIssueFieldProfile,
+    variant: Optional[object],
+    schema: Optional[GraphQLSchema],
+):
+    # What LinearClient used to do on every call: build the source, parse it and let gql validate it again
+    document = gql(LINEAR_DOCUMENT_SOURCES[operation](profile=profile, variant=variant))
+    if schema:
+        validate(schema, document)
+    return document
+
+
+def precompiled_per_request(
+    operation: LinearOperation,
+    profile: LinearIssueFieldProfile,
+    variant: Optional[object],
+):
+    return get_linear_document(operation, profile=profile, variant=variant)
+
+
+def main():
+    # Validation is only measured if the schema was persisted by an earlier run against Linear
+    schema: Optional[GraphQLSchema] = LINEAR_SCHEMA_CACHE.get()
+    print(f"Validating against the cached schema: {schema is not None}")
+    for operation, profile, variant in OPERATIONS:
+        parsed: float = timeit.timeit(
+            lambda: parse_per_request(operation, profile, variant, schema),
+            number=REQUESTS,
+        )
+        precompiled: float = timeit.timeit(
+            lambda: precompiled_per_request(operation, profile, variant),
+            number=REQUESTS,
+        )
+        print(
+            f"{operation} ({profile}{f', {variant}' if variant else ''}): "
+            f"parsed {parsed / REQUESTS * 1e6:.1f}us/request, "
+            f"precompiled {precompiled / REQUESTS * 1e6:.2f}us/request, "
+            f"saved {(parsed - precompiled) * 1e3:.0f}ms of CPU over {REQUESTS} requests"
+        )
+
+
+if __name__ == "__main__":
+    main()
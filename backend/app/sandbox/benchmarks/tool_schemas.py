@@ -0,0 +1,58 @@
+import timeit
+
+from app.models.agents.base.template import Agent
+from app.models.agents.gmail import GMAIL_TRIAGE_AGENT
+from app.models.agents.linear import LINEAR_TRIAGE_AGENT
+from app.models.agents.main import MAIN_TRIAGE_AGENT
+from app.models.agents.slack import SLACK_TRIAGE_AGENT
+from app.models.query import Message, Role
+from app.utils.tools import function_to_schema
+
+HOPS = 10_000
+
+TRIAGE_AGENTS: list[Agent] = [
+    MAIN_TRIAGE_AGENT,
+    GMAIL_TRIAGE_AGENT,
+    LINEAR_TRIAGE_AGENT,
+    SLACK_TRIAGE_AGENT,
+]
+
+
+def rebuild_per_hop(agent: Agent, chat_history: list[Message]):
+    # What TriageAgent.query used to do on every hop before sending the request
+    message_lst: list = [{"role": "system", "content": agent.system_prompt}]
+    message_lst.extend(chat_history)
+    tool_schemas = [function_to_schema(tool) for tool in agent.tools]
+    tools = {tool.__name__: tool for tool in agent.tools}
+    return message_lst, tool_schemas, tools
+
+
+def precompiled_per_hop(agent: Agent, chat_history: list[Message]):
+    return (
+        agent.build_messages(chat_history),
+        list(agent._tool_schemas),
+        agent.tool_dispatch,
+    )
+
+
+def main():
+    chat_history: list[Message] = [
+        Message(role=Role.USER, content="Get all my Linear issues in the Todo state")
+    ]
+    for agent in TRIAGE_AGENTS:
+        rebuilt: float = timeit.timeit(
+            lambda: rebuild_per_hop(agent, chat_history), number=HOPS
+        )
+        precompiled: float = timeit.timeit(
+            lambda: precompiled_per_hop(agent, chat_history), number=HOPS
+        )
+        print(
+            f"{agent.name} ({agent.integration_group}, {len(agent.tools)} tools): "
+            f"rebuilt {rebuilt / HOPS * 1e6:.1f}us/hop, "
+            f"precompiled {precompiled / HOPS * 1e6:.1f}us/hop, "
+            f"saved {(rebuilt - precompiled) * 1e3:.0f}ms of CPU over {HOPS} hops"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 
 from dotenv import load_dotenv
@@ -25,7 +26,7 @@ client = LinearClient(
 )
 
 
-def main():
+async def main():
     # chat_history: list[Message] = []
     # message = Message(
     #     role=Role.USER,
@@ -44,7 +45,7 @@ def main():
     #     chat_history.append(Message(role=Role.ASSISTANT, content=str(response.message)))
     # print(chat_history)
     print(
-        client.get_issues(
+        await client.get_issues(
             request=LinearGetIssuesRequest(
                 id=None,
                 state=None,
@@ -60,7 +61,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 ### HARD CODE TEST
 ## Create Issue
@@ -1,3 +1,4 @@
+import asyncio
 import os
 
 from dotenv import load_dotenv
@@ -18,7 +19,7 @@ SLACK_ACCESS_TOKEN = os.getenv("SLACK_ACCESS_TOKEN")
 client = SlackClient(access_token=SLACK_ACCESS_TOKEN)
 
 
-def main():
+async def main():
     # HARD CODE TEST
 
     ## AGENT TEST
@@ -31,7 +32,7 @@ def main():
     response = AgentResponse(agent=MAIN_TRIAGE_AGENT, message=message)
     while response.agent:
         prev_agent: Agent = response.agent
-        response = response.agent.query(
+        response = await response.agent.query(
             chat_history=chat_history,
             access_token=SLACK_ACCESS_TOKEN,
             refresh_token=None,
@@ -46,7 +47,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
 ### HARD CODE TEST
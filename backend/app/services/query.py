@@ -1,21 +1,39 @@
 import asyncio
 import logging
-from typing import Optional
+import time
+from typing import AsyncIterator, Optional
 
 from pydantic import BaseModel
 
+from app.config import DEFAULT_MAX_AGENT_HOPS, DEFAULT_QUERY_DEADLINE_SECONDS
+from app.connectors.client.llm import get_llm_pool_stats
 from app.connectors.native.stores.token import Token
-from app.exceptions.exception import DatabaseError
-from app.models.agents.base.template import Agent, AgentResponse
+from app.exceptions.exception import DatabaseError, PipelineError
+from app.models.agents.base.request import (
+    RequestAgent,
+    gather_agent_responses,
+    merge_agent_responses,
+)
+from app.models.agents.base.summary import SummaryAgent
+from app.models.agents.base.template import Agent, AgentResponse, RoutedRequest
 from app.models.agents.base.triage import TriageAgent
 from app.models.agents.gmail import GMAIL_TRIAGE_AGENT
 from app.models.agents.linear import LINEAR_TRIAGE_AGENT
-from app.models.agents.main import MAIN_TRIAGE_AGENT
+from app.models.agents.main import MAIN_TRIAGE_AGENT, get_entry_agent
+from app.models.agents.router import get_router_agent
 from app.models.integrations.base import Integration
-from app.models.query import Message, QueryResponse, Role
+from app.models.query import (
+    Message,
+    QueryResponse,
+    QueryStreamEvent,
+    QueryStreamEventType,
+    Role,
+    RoutingMode,
+)
 from app.services.message import MessageService
 from app.services.token import TokenService
 from app.services.user import UserService
+from app.utils.usage import get_prompt_cache_stats
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -30,48 +48,122 @@ class QueryService:
         api_key: str,
         integrations: list[Integration],
         instance: Optional[str],
+        routing_mode: RoutingMode = RoutingMode.FLAT,
     ) -> QueryResponse:
+        async for event in self.stream_query(
+            message=message,
+            chat_history=chat_history,
+            api_key=api_key,
+            integrations=integrations,
+            instance=instance,
+            routing_mode=routing_mode,
+            stream_summary=False,
+        ):
+            if event.event == QueryStreamEventType.DONE:
+                return event.response
+        raise PipelineError("Query finished without a response")
+
+    async def stream_query(
+        self,
+        message: Message,
+        chat_history: list[Message],
+        api_key: str,
+        integrations: list[Integration],
+        instance: Optional[str],
+        routing_mode: RoutingMode = RoutingMode.FLAT,
+        stream_summary: bool = True,
+    ) -> AsyncIterator[QueryStreamEvent]:
+        """Runs the agent loop and yields an event as soon as each step completes. The last event is always DONE with the persisted instance."""
+        user, *integration_tokens = await asyncio.gather(
+            UserService().get(api_key=api_key),
+            *[
+                TokenService().get(api_key=api_key, table_name=integration)
+                for integration in integrations
+            ],
+        )
         tokens: dict[str, Token] = {}
-        for integration in integrations:
-            token: Optional[Token] = await TokenService().get(
-                api_key=api_key, table_name=integration
-            )
+        for integration, token in zip(integrations, integration_tokens):
             if not token:
                 raise DatabaseError(
                     f"User has not authenticated with the {integration} table. Please authenticate before trying again."
                 )
             tokens[integration] = token
+        max_agent_hops: int = user.max_agent_hops or DEFAULT_MAX_AGENT_HOPS
+        deadline: float = time.monotonic() + (
+            user.query_deadline_seconds or DEFAULT_QUERY_DEADLINE_SECONDS
+        )
+        turn_start: int = len(chat_history)
         chat_history.append(message)
-        agent_chat_history: list[Message] = []
-        for msg in chat_history:
-            agent_chat_history.append(
-                Message(
-                    role=Role.ASSISTANT,
-                    content=f"{msg.content}: {str(msg.data)}",
-                    data=None,
-                )
-            )
-        response = AgentResponse(agent=MAIN_TRIAGE_AGENT, message=message)
+        # With a single enabled integration this is its triage agent, which can also hand over to the summary agent, so the main triage hop is skipped
+        triage_agent: Agent = get_entry_agent(integrations=integrations)
+        entry_agent: Agent = (
+            get_router_agent(integrations=integrations)
+            if routing_mode == RoutingMode.FLAT
+            else triage_agent
+        )
+        response = AgentResponse(agent=entry_agent, message=message)
+        hops: int = 0
         while response.agent:
+            if response.agent is MAIN_TRIAGE_AGENT:
+                # Request agents hand control back to the generic main triage agent, so swap in the one for this request
+                response.agent = triage_agent
             prev_agent: Agent = response.agent
-            integration_group: Integration = response.agent.integration_group
-            if integration_group == Integration.NONE:
-                response = response.agent.query(
-                    chat_history=agent_chat_history,
-                    access_token="",
-                    refresh_token="",
-                    client_id="",
-                    client_secret="",
+            remaining_seconds: float = deadline - time.monotonic()
+            cutoff_reason: Optional[str] = None
+            interrupted_calls: bool = False
+            if remaining_seconds <= 0:
+                cutoff_reason = "it took too long"
+            elif hops >= max_agent_hops and not isinstance(prev_agent, SummaryAgent):
+                cutoff_reason = "it needed too many steps"
+            elif stream_summary and isinstance(prev_agent, SummaryAgent):
+                # The summary is the last step and is already streaming to the user, so it is left to the LLM client timeouts
+                summary: str = ""
+                async for summary_token in prev_agent.stream(chat_history=chat_history):
+                    summary += summary_token
+                    yield QueryStreamEvent(
+                        event=QueryStreamEventType.SUMMARY, token=summary_token
+                    )
+                response = AgentResponse(
+                    agent=None, message=Message(role=Role.ASSISTANT, content=summary)
                 )
             else:
-                response = response.agent.query(
-                    chat_history=agent_chat_history,
-                    access_token=tokens[integration_group].access_token,
-                    refresh_token=tokens[integration_group].refresh_token,
-                    client_id=tokens[integration_group].client_id,
-                    client_secret=tokens[integration_group].client_secret,
+                try:
+                    # Stops waiting for the in-flight LLM or connector call once the deadline passes
+                    response = await asyncio.wait_for(
+                        _run_agent(
+                            response=response,
+                            chat_history=chat_history,
+                            tokens=tokens,
+                        ),
+                        timeout=remaining_seconds,
+                    )
+                except TimeoutError:
+                    cutoff_reason = "it took too long"
+                    # Connector calls run in worker threads that cannot be cancelled, so a write may still complete after the cutoff
+                    interrupted_calls = bool(response.routed_requests) or isinstance(
+                        prev_agent, RequestAgent
+                    )
+            if cutoff_reason:
+                log.warning(
+                    f"Stopping agent loop after {hops} hops at {prev_agent.name} because {cutoff_reason}"
+                )
+                chat_history.append(
+                    _partial_summary(
+                        turn_history=chat_history[turn_start:],
+                        reason=cutoff_reason,
+                        interrupted_calls=interrupted_calls,
+                    )
+                )
+                yield QueryStreamEvent(
+                    event=QueryStreamEventType.SUMMARY,
+                    token=chat_history[-1].content,
                 )
+                break
+            hops += 1
             if isinstance(prev_agent, TriageAgent):
+                yield QueryStreamEvent(
+                    event=QueryStreamEventType.TRIAGE, message=response.message
+                )
                 continue
             chat_history.append(
                 Message(
@@ -81,15 +173,12 @@ class QueryService:
                     error=response.message.error,
                 )
             )
-            # Agent seems to just ignore the data field and only bases its judgement on the content field
-            agent_chat_history.append(
-                Message(
-                    role=Role.ASSISTANT,
-                    content=f"{response.message.content}: {str(response.message.data)}",
-                    data=None,
-                    error=response.message.error,
+            if not isinstance(prev_agent, SummaryAgent):
+                yield QueryStreamEvent(
+                    event=QueryStreamEventType.RESULT, message=chat_history[-1]
                 )
-            )
+        log.info(f"LLM connection pool stats: {get_llm_pool_stats()}")
+        log.info(f"LLM prompt cache stats: {get_prompt_cache_stats()}")
         results = await asyncio.gather(
             UserService().increment_usage(api_key=api_key),
             MessageService().post(
@@ -100,9 +189,12 @@ class QueryService:
             ),
         )
 
-        return QueryResponse(
-            chat_history=[msg for msg in chat_history if not msg.error],
-            instance=results[1],
+        yield QueryStreamEvent(
+            event=QueryStreamEventType.DONE,
+            response=QueryResponse(
+                chat_history=[msg for msg in chat_history if not msg.error],
+                instance=results[1],
+            ),
         )
 
     async def query_linear(
@@ -117,12 +209,12 @@ class QueryService:
                 f"User has not authenticated with the {TABLE_NAME} table. Please authenticate before trying again."
             )
 
-        curr_agent: Agent = LINEAR_TRIAGE_AGENT.query(
+        curr_agent: Agent = await LINEAR_TRIAGE_AGENT.query(
             chat_history=chat_history,
             access_token=token.access_token,
             refresh_token=token.refresh_token,
         )
-        response: list[BaseModel] = curr_agent.query(
+        response: list[BaseModel] = await curr_agent.query(
             chat_history=chat_history,
             access_token=token.access_token,
             refresh_token=token.refresh_token,
@@ -141,14 +233,14 @@ class QueryService:
                 f"User has not authenticated with the {TABLE_NAME} table. Please authenticate before trying again."
             )
 
-        curr_agent: Agent = GMAIL_TRIAGE_AGENT.query(
+        curr_agent: Agent = await GMAIL_TRIAGE_AGENT.query(
             messages=chat_history,
             access_token=token.access_token,
             refresh_token=token.refresh_token,
             client_id=token.client_id,
             client_secret=token.client_secret,
         )
-        response: list[BaseModel] = curr_agent.query(
+        response: list[BaseModel] = await curr_agent.query(
             chat_history=chat_history,
             access_token=token.access_token,
             refresh_token=token.refresh_token,
@@ -156,3 +248,71 @@ class QueryService:
             client_secret=token.client_secret,
         )
         return response
+
+
+async def _run_agent(
+    response: AgentResponse,
+    chat_history: list[Message],
+    tokens: dict[str, Token],
+) -> AgentResponse:
+    integration_group: Integration = response.agent.integration_group
+    if response.routed_requests:
+        # The router agent already chose and filled in the requests, so only the connector calls are left
+        return merge_agent_responses(
+            await gather_agent_responses(
+                [
+                    _execute_routed_request(routed=routed, tokens=tokens)
+                    for routed in response.routed_requests
+                ]
+            )
+        )
+    if integration_group == Integration.NONE:
+        return await response.agent.query(
+            chat_history=chat_history,
+            access_token="",
+            refresh_token="",
+            client_id="",
+            client_secret="",
+        )
+    return await response.agent.query(
+        chat_history=chat_history,
+        access_token=tokens[integration_group].access_token,
+        refresh_token=tokens[integration_group].refresh_token,
+        client_id=tokens[integration_group].client_id,
+        client_secret=tokens[integration_group].client_secret,
+    )
+
+
+async def _execute_routed_request(
+    routed: RoutedRequest, tokens: dict[str, Token]
+) -> AgentResponse:
+    token: Token = tokens[routed.agent.integration_group]
+    return await routed.agent.execute(
+        function_name=routed.function_name,
+        request=routed.request,
+        access_token=token.access_token,
+        refresh_token=token.refresh_token,
+        client_id=token.client_id,
+        client_secret=token.client_secret,
+    )
+
+
+def _partial_summary(
+    turn_history: list[Message], reason: str, interrupted_calls: bool = False
+) -> Message:
+    """Cheap stand-in for the summary agent when the loop is cut short, listing what was completed without another LLM call"""
+    completed: list[str] = [
+        msg.content
+        for msg in turn_history
+        if msg.role == Role.ASSISTANT and not msg.error
+    ]
+    content: str = f"I could not finish this task because {reason}."
+    if completed:
+        content += " Here is what was completed so far:\n" + "\n".join(
+            f"- {step}" for step in completed
+        )
+    elif not interrupted_calls:
+        content += " Nothing was completed yet. Please try again with a more specific instruction."
+    if interrupted_calls:
+        content += "\nAn action that was still running when I stopped, such as sending, updating or deleting, may have gone through anyway. Please check before trying again."
+    return Message(role=Role.ASSISTANT, content=content)
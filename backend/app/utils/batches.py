@@ -0,0 +1,8 @@
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def batches(items: list[T], size: int) -> list[list[T]]:
+    """Splits items into consecutive lists of at most size items"""
+    return [items[start : start + size] for start in range(0, len(items), size)]
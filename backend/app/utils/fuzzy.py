@@ -0,0 +1,147 @@
+import re
+from collections import defaultdict
+from typing import Iterable, Optional
+
+# Typos allowed per this many characters of the name, and never more than MAX_EDIT_DISTANCE
+CHARACTERS_PER_EDIT = 4
+MAX_EDIT_DISTANCE = 3
+# Short names are one typo away from other real names (e.g. "Bob" and "Rob"), so they only match exactly or by case
+MIN_EDIT_DISTANCE_LENGTH = 5
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class AmbiguousNameError(ValueError):
+    def __init__(self, name: str, candidates: list[str]):
+        self.name = name
+        self.candidates = candidates
+        super().__init__(
+            f"'{name}' could refer to any of: {', '.join(candidates)}. Please ask the user which one they meant."
+        )
+
+
+class UnconfirmedNameError(ValueError):
+    def __init__(self, name: str, match: str):
+        self.name = name
+        self.match = match
+        super().__init__(
+            f"'{name}' was not found, the closest match is '{match}'. Please ask the user to confirm that they meant '{match}'."
+        )
+
+
+class FuzzyNameIndex:
+    """Resolves misspelled or differently capitalised names to the known names they most likely refer to, trying exact, case-folded, token and edit distance matches in that order."""
+
+    def __init__(self, names: Iterable[str]):
+        self._names: set[str] = set(names)
+        self._by_normalized: defaultdict[str, set[str]] = defaultdict(set)
+        self._by_token: defaultdict[str, set[str]] = defaultdict(set)
+        for name in self._names:
+            self._by_normalized[_normalize(name)].add(name)
+            for token in _tokens(name):
+                self._by_token[token].add(name)
+        # Edit distance candidates are whole names and their single tokens, so that "alise" still finds "Alice Wong"
+        self._bigrams: dict[str, frozenset[str]] = {
+            key: _bigrams(key) for key in (*self._by_normalized, *self._by_token)
+        }
+        self._resolved: dict[str, Optional[str]] = {}
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Returns the known name that name refers to, or None if nothing is close enough. Raises AmbiguousNameError if several names are equally close."""
+        if name in self._names:
+            return name
+        if name not in self._resolved:
+            self._resolved[name] = self._resolve(name)
+        return self._resolved[name]
+
+    def _resolve(self, name: str) -> Optional[str]:
+        normalized: str = _normalize(name)
+        if not normalized:
+            return None
+        # "john smith" -> "John Smith"
+        if normalized in self._by_normalized:
+            return _unique(name, self._by_normalized[normalized])
+
+        # "john" -> "John Smith", every token of the name has to appear in the candidate
+        tokens: list[str] = _tokens(name)
+        token_matches: set[str] = set.intersection(
+            *[self._by_token.get(token, set()) for token in tokens]
+        )
+        if token_matches:
+            return _unique(name, token_matches)
+
+        # "Jhon Smtih" -> "John Smith"
+        if len(normalized) < MIN_EDIT_DISTANCE_LENGTH:
+            return None
+        max_distance: int = min(
+            MAX_EDIT_DISTANCE, max(1, len(normalized) // CHARACTERS_PER_EDIT)
+        )
+        bigrams: frozenset[str] = _bigrams(normalized)
+        best_distance: int = max_distance + 1
+        best_matches: set[str] = set()
+        for candidate, candidate_bigrams in self._bigrams.items():
+            if abs(len(candidate) - len(normalized)) > max_distance:
+                continue
+            # Each edit (or transposition) changes at most three bigrams, so strings sharing fewer cannot be close enough
+            if len(bigrams & candidate_bigrams) < (
+                max(len(bigrams), len(candidate_bigrams)) - 3 * max_distance
+            ):
+                continue
+            candidate_names: set[str] = self._by_normalized.get(
+                candidate, set()
+            ) | self._by_token.get(candidate, set())
+            distance: int = _edit_distance(normalized, candidate, limit=max_distance)
+            if distance > max_distance:
+                continue
+            if distance < best_distance:
+                best_distance, best_matches = distance, set(candidate_names)
+            elif distance == best_distance:
+                best_matches |= candidate_names
+        return _unique(name, best_matches) if best_matches else None
+
+
+def is_same_name(a: str, b: str) -> bool:
+    """Whether two names only differ in case, spacing or punctuation, which never makes them refer to different things"""
+    return _normalize(a) == _normalize(b)
+
+
+def _normalize(name: str) -> str:
+    return " ".join(_tokens(name))
+
+
+def _tokens(name: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(name.casefold())
+
+
+def _bigrams(normalized: str) -> frozenset[str]:
+    return frozenset(normalized[i : i + 2] for i in range(len(normalized) - 1))
+
+
+def _unique(name: str, matches: set[str]) -> str:
+    if len(matches) > 1:
+        raise AmbiguousNameError(name=name, candidates=sorted(matches))
+    return next(iter(matches))
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions), returning limit + 1 as soon as it is exceeded"""
+    previous_previous: Optional[list[int]] = None
+    previous: list[int] = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current: list[int] = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost: int = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if (
+                previous_previous
+                and i > 1
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
@@ -0,0 +1,110 @@
+import logging
+from typing import Any, Union
+
+from app.models.query import Message, Role
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+MAX_REFERENCED_IDS = 50
+MAX_FOLDED_CONTENT_CHARS = 120
+# Messages are folded in whole blocks, each into its own summary, so that the start of the prompt only grows once per block
+FOLD_BLOCK_SIZE = 8
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text and JSON, which is close enough to budget prompts with
+    return len(text) // 4 + 1
+
+
+def render_message(message: Message) -> Message:
+    # Agent seems to just ignore the data field and only bases its judgement on the content field
+    return Message(
+        role=Role.ASSISTANT,
+        content=f"{message.content}: {str(message.data)}",
+        data=None,
+        error=message.error,
+    )
+
+
+def compact_chat_history(
+    chat_history: list[Union[Message, dict]],
+    token_budget: int,
+    keep_recent: int,
+    agent_name: str,
+) -> list[Message]:
+    """Renders the chat history for an agent and fits it into token_budget.
+
+    The last keep_recent messages are always kept verbatim. Once over budget, every older message has its data payload replaced by a reference to the ids it contained, and every whole block of FOLD_BLOCK_SIZE older messages, counted from the start of the history, is folded into a summary of its own.
+
+    Once compaction kicks in, what happens to a message only depends on its position and not on how many tokens still have to be saved. A folded block renders the same on every later hop and new block summaries are appended after the earlier ones, so the rendered prefix stays byte-identical from one hop to the next (apart from once per newly folded block) and provider-side prompt caching keeps working.
+    """
+    messages: list[Message] = [
+        Message.model_validate(message) if isinstance(message, dict) else message
+        for message in chat_history
+    ]
+    compacted: list[Message] = [render_message(message) for message in messages]
+    message_tokens: list[int] = [estimate_tokens(msg.content) for msg in compacted]
+    original_tokens: int = sum(message_tokens)
+    total_tokens: int = original_tokens
+    if total_tokens <= token_budget:
+        return compacted
+
+    compactable: int = max(len(messages) - keep_recent, 0)
+    for idx in range(compactable):
+        if not messages[idx].data:
+            continue
+        compacted[idx] = Message(
+            role=Role.ASSISTANT,
+            content=f"{messages[idx].content}: {_data_reference(messages[idx].data)}",
+            data=None,
+            error=messages[idx].error,
+        )
+        reference_tokens: int = estimate_tokens(compacted[idx].content)
+        total_tokens += reference_tokens - message_tokens[idx]
+        message_tokens[idx] = reference_tokens
+
+    # Never fold away the latest user instruction, since every agent needs it to do its job
+    last_user_idx: int = max(
+        (idx for idx, message in enumerate(messages) if message.role == Role.USER),
+        default=len(messages),
+    )
+    foldable: int = min(compactable, last_user_idx)
+    # Partial blocks are left alone, folding them would rewrite their summary on every hop until the block is full
+    folded: int = foldable // FOLD_BLOCK_SIZE * FOLD_BLOCK_SIZE
+    if folded:
+        block_summaries: list[Message] = [
+            Message(
+                role=Role.ASSISTANT,
+                content="Earlier in this conversation: "
+                + " | ".join(
+                    _truncate(message.content, MAX_FOLDED_CONTENT_CHARS)
+                    for message in messages[start : start + FOLD_BLOCK_SIZE]
+                ),
+                data=None,
+            )
+            for start in range(0, folded, FOLD_BLOCK_SIZE)
+        ]
+        total_tokens += sum(
+            estimate_tokens(summary.content) for summary in block_summaries
+        ) - sum(message_tokens[:folded])
+        compacted = block_summaries + compacted[folded:]
+
+    log.info(
+        f"{agent_name}: compacted chat history from ~{original_tokens} to ~{total_tokens} tokens (budget {token_budget}, saved ~{original_tokens - total_tokens})"
+    )
+    return compacted
+
+
+def _data_reference(data: list[dict[str, Any]]) -> str:
+    ids: list[str] = [str(item["id"]) for item in data if item.get("id")]
+    if not ids:
+        return f"[{len(data)} item(s) omitted]"
+    referenced: str = ", ".join(ids[:MAX_REFERENCED_IDS])
+    if len(ids) > MAX_REFERENCED_IDS:
+        referenced += ", ..."
+    return f"[{len(data)} item(s) omitted, ids: {referenced}]"
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else f"{text[:max_chars]}..."
@@ -16,7 +16,7 @@ def execute_tool_call(tool_call, tools, agent_name):
     return tools[name](**args)  # call corresponding function with provided arguments
 
 
-def function_to_schema(func) -> dict:
+def function_to_schema(func, strict: bool = False) -> dict:
     type_map = {
         str: "string",
         int: "integer",
@@ -50,7 +50,7 @@ def function_to_schema(func) -> dict:
         if param.default == inspect._empty
     ]
 
-    return {
+    schema = {
         "type": "function",
         "function": {
             "name": func.__name__,
@@ -62,3 +62,8 @@ def function_to_schema(func) -> dict:
             },
         },
     }
+    if strict:
+        # Strict tools can be mixed with openai.pydantic_function_tool schemas in beta.chat.completions.parse
+        schema["function"]["strict"] = True
+        schema["function"]["parameters"]["additionalProperties"] = False
+    return schema
@@ -0,0 +1,48 @@
+import logging
+from collections import defaultdict
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class PromptCacheStats(BaseModel):
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+# Process-wide totals keyed by agent, since the provider only reports cache hits per completion
+_prompt_cache_stats: defaultdict[str, PromptCacheStats] = defaultdict(PromptCacheStats)
+
+
+def record_prompt_usage(agent_key: str, usage: Optional[Any]) -> None:
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    # Older openai versions keep the field as a plain dict on the usage model
+    cached_tokens: int = (
+        details.get("cached_tokens")
+        if isinstance(details, dict)
+        else getattr(details, "cached_tokens", None)
+    ) or 0
+    stats: PromptCacheStats = _prompt_cache_stats[agent_key]
+    stats.calls += 1
+    stats.prompt_tokens += usage.prompt_tokens
+    stats.cached_tokens += cached_tokens
+    log.info(
+        f"{agent_key}: {cached_tokens}/{usage.prompt_tokens} prompt tokens cached (agent hit rate {stats.hit_rate:.0%})"
+    )
+
+
+def get_prompt_cache_stats() -> dict[str, dict[str, Any]]:
+    return {
+        agent_key: {**stats.model_dump(), "hit_rate": round(stats.hit_rate, 3)}
+        for agent_key, stats in _prompt_cache_stats.items()
+    }
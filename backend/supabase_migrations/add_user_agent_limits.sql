@@ -0,0 +1,6 @@
+-- Adds the per API key overrides of the agent loop limits to a database created from an older supabase_schema.sql
+-- NULL means the defaults in app/config.py apply, so existing users keep the default limits
+
+ALTER TABLE public."user"
+    ADD COLUMN IF NOT EXISTS max_agent_hops integer DEFAULT NULL,
+    ADD COLUMN IF NOT EXISTS query_deadline_seconds double precision DEFAULT NULL;
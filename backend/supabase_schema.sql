@@ -2402,7 +2402,9 @@ CREATE TABLE public."user" (
     usage bigint DEFAULT '0'::bigint NOT NULL,
     api_key uuid DEFAULT gen_random_uuid() NOT NULL,
     created_at timestamp with time zone DEFAULT now() NOT NULL,
-    updated_at timestamp with time zone DEFAULT now() NOT NULL
+    updated_at timestamp with time zone DEFAULT now() NOT NULL,
+    max_agent_hops integer,
+    query_deadline_seconds double precision
 );
 
 